@@ -8,6 +8,7 @@ import platform
 
 from lxml import etree
 
+from . import domain
 from .domain import XMLValidator, HTMLGenerator
 from .utils import XML
 from .version import __version__
@@ -64,6 +65,7 @@ def get_debug_info():
         'libxslt_version': LIBXSLT_VERSION,
         'lxml_version': LXML_VERSION,
         'xml_catalog_files': os.environ.get('XML_CATALOG_FILES', ''),
+        'cache_dir': domain.CACHE_DIR,
         'system_path': sys.path,
         'packtools_version': __version__,
         'python_version': platform.python_version(),
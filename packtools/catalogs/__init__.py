@@ -23,6 +23,14 @@ SCHEMAS = {
         _CWD, 'pmc-publishing-dtd-3.0/journalpublishing3.dtd'),
 }
 
+# DTD public ids and the logical names of their files in `SCHEMAS`.
+DTD_PUBLIC_IDS = {
+    '-//NLM//DTD JATS (Z39.96) Journal Publishing DTD v1.0 20120330//EN':
+        'JATS-journalpublishing1.dtd',
+    '-//NLM//DTD Journal Publishing DTD v3.0 20080202//EN':
+        'journalpublishing3.dtd',
+}
+
 # XML Catalog - OASIS Standard.
 XML_CATALOG = os.path.join(_CWD, 'scielo-publishing-schema.xml')
 
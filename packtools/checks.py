@@ -3,10 +3,13 @@ from __future__ import unicode_literals
 import re
 import logging
 import itertools
+import functools
+from collections import OrderedDict
 from datetime import datetime
 
 import plumber
 
+from . import utils
 from .style_errors import StyleError
 
 
@@ -37,15 +40,189 @@ def teardown(message):
 
 def StyleCheckingPipeline():
     """Factory for style checking pipelines.
+
+    All checks are run by a single pipe, which walks the etree only once.
+    """
+    return plumber.Pipeline(setup, style_checks, teardown)
+
+
+# --------------------------------
+# Single traversal dispatch
+# --------------------------------
+_PATH_TOKENS = re.compile(r'//|/|[^/\[]+(?:\[[^\]]*\])?')
+_PATH_STEP = re.compile(r'''^(?P<tag>[\w.-]+)'''
+                        r'''(?:\[@(?P<attr>[\w.-]+)'''
+                        r'''(?:=(?P<quote>["'])(?P<value>.*?)(?P=quote))?\])?$''')
+
+
+class PathMatcher(object):
+    """Tests if elements match `path`, in the same way ``findall`` does
+    relative to the root element.
+
+    Only a subset of the ElementPath syntax is supported: tag names,
+    the child (``/``) and descendant (``//``) axes, and predicates on the
+    presence (``[@attr]``) or the value (``[@attr="value"]``) of an
+    attribute. A leading ``.//`` matches elements at any depth.
+
+    :param path: the path expression.
+    """
+    def __init__(self, path):
+        self.path = path
+
+        tokens = _PATH_TOKENS.findall(path[1:] if path.startswith('.//') else path)
+        if ''.join(tokens) != path.lstrip('.'):
+            raise ValueError('Unsupported path: %s' % path)
+
+        self.steps = []
+        axis = '/'
+        for token in tokens:
+            if token in ('/', '//'):
+                axis = token
+                continue
+
+            step = _PATH_STEP.match(token)
+            if step is None:
+                raise ValueError('Unsupported path: %s' % path)
+
+            self.steps.append((axis, step.group('tag'), step.group('attr'),
+                               step.group('value')))
+            axis = '/'
+
+        if not self.steps or tokens[-1] in ('/', '//'):
+            raise ValueError('Unsupported path: %s' % path)
+
+        # the tag of the elements that may match the path
+        self.tag = self.steps[-1][1]
+
+    def _match_step(self, elem, index):
+        _, tag, attr, value = self.steps[index]
+        if elem.tag != tag:
+            return False
+        elif attr is None:
+            return True
+        elif value is None:
+            return elem.get(attr) is not None
+        else:
+            return elem.get(attr) == value
+
+    def _match(self, elem, index, root):
+        if not self._match_step(elem, index):
+            return False
+
+        axis = self.steps[index][0]
+        if index == 0:
+            if axis == '/':
+                return elem.getparent() is root
+            else:
+                return elem is not root
+
+        if axis == '/':
+            parent = elem.getparent()
+            return (parent is not None and parent is not root and
+                    self._match(parent, index - 1, root))
+
+        for ancestor in elem.iterancestors():
+            if ancestor is root:
+                return False
+            if self._match(ancestor, index - 1, root):
+                return True
+
+        return False
+
+    def match(self, elem, root):
+        """Returns True if `elem` matches the path relative to `root`.
+        """
+        return self._match(elem, len(self.steps) - 1, root)
+
+
+class TreeVisitor(object):
+    """Walks an etree once, calling the callbacks registered for the paths
+    each element matches.
+
+    The callbacks are called in document order, with the matching element
+    as the only argument.
+    """
+    def __init__(self):
+        # maps tag names to a list of (<PathMatcher>, <callback>)
+        self._callbacks = OrderedDict()
+
+    def register(self, path, callback):
+        matcher = PathMatcher(path)
+        self._callbacks.setdefault(matcher.tag, []).append((matcher, callback))
+
+    def walk(self, et):
+        if not self._callbacks:
+            return
+
+        root = et.getroot()
+        for elem in root.iter(*self._callbacks):
+            for matcher, callback in self._callbacks[elem.tag]:
+                if matcher.match(elem, root):
+                    callback(elem)
+
+
+def check(*paths):
+    """Declares a style check, that is a function that receives an etree
+    and a dict mapping each one of `paths` to the list of matching elements,
+    in document order, and returns a list of `StyleError`.
+
+    The elements are collected by :func:`run_checks`.
     """
-    return plumber.Pipeline(setup, funding_group, doctype, teardown)
+    def decorator(func):
+        func.paths = paths
+        return func
+    return decorator
+
+
+def run_checks(et, checks):
+    """Runs `checks` over `et`, and returns the list of errors.
+
+    The elements needed by all checks are collected walking the etree
+    only once.
+
+    :param et: etree instance.
+    :param checks: list of functions decorated by :func:`check`.
+    """
+    visitor = TreeVisitor()
+    collected = []
+    for check_func in checks:
+        elements = OrderedDict((path, []) for path in check_func.paths)
+        for path, matches in elements.items():
+            visitor.register(path, matches.append)
+
+        collected.append((check_func, elements))
+
+    visitor.walk(et)
+
+    errors = []
+    for check_func, elements in collected:
+        errors.extend(check_func(et, elements))
+
+    return errors
+
+
+def _make_filter(check_func):
+    """Returns a filter that runs `check_func` alone.
+    """
+    @plumber.filter
+    @functools.wraps(check_func)
+    def check_filter(message):
+        et, err_list = message
+        err_list.extend(run_checks(et, [check_func]))
+        return message
+
+    return check_filter
 
 
 # --------------------------------
 # Funding Group check
 # --------------------------------
-@plumber.filter
-def funding_group(message):
+@check('front//funding-group//award-id',
+       'front//funding-group/award-group/award-id',
+       'back//fn[@fn-type="financial-disclosure"]',
+       'back//fn[@fn-type="financial-disclosure"]/p',
+       'back//ack/p')
+def check_funding_group(et, elements):
     """Validate the Funding Group element
 
     Ref. URI:
@@ -55,11 +232,11 @@ def funding_group(message):
     Element may be found in:
       - /article/front/article-meta/funding_group
     """
-    et, err_list = message
+    err_list = []
 
-    funding_groups = et.findall('front//funding-group//award-id')
-    financial_disclosures = et.findall(
-            'back//fn[@fn-type="financial-disclosure"]')
+    funding_groups = elements['front//funding-group//award-id']
+    financial_disclosures = elements[
+            'back//fn[@fn-type="financial-disclosure"]']
     has_funding_group = bool(all([bool(elem.text)
                                   for elem in funding_groups]))
     has_financial_disclosure = bool(financial_disclosures)
@@ -80,60 +257,71 @@ def funding_group(message):
                 return u''
 
         # only the main document is relevant
-        award_ids = [elem.text for elem in et.findall(
-            'front//funding-group/award-group/award-id')
+        award_ids = [elem.text for elem in elements[
+            'front//funding-group/award-group/award-id']
             if elem.text is not None]
-        fn_occs = [get_text(elem) for elem in et.findall(
-            'back//fn[@fn-type="financial-disclosure"]/p')]
-        ack_occs = [get_text(elem) for elem in et.findall(
-            'back//ack/p')]
-
-        def in_there(award_id, texts):
-            for text in texts:
-                if award_id in text:
-                    return True
-                else:
-                    LOGGER.debug('Cannot find "%s" in "%s".', award_id, text)
-
-            return False
+        fn_occs = [get_text(elem) for elem in elements[
+            'back//fn[@fn-type="financial-disclosure"]/p']]
+        ack_occs = [get_text(elem) for elem in elements['back//ack/p']]
 
         LOGGER.info('Declared contract numbers: %s', award_ids)
 
-        missing_award_ids = set(award_ids)
         paragraphs = [p for p in itertools.chain(fn_occs, ack_occs) if p]
+        if paragraphs:
+            # all award-ids are looked up in a single pass over the text.
+            # the paragraphs are joined by a char that is not allowed in XML,
+            # so an award-id cannot match across paragraphs.
+            matcher = utils.AhoCorasick(set(award_ids))
+            found_award_ids = matcher.search('\x00'.join(paragraphs))
+        else:
+            found_award_ids = set()
 
-        for award_id in award_ids:
-            if in_there(award_id, paragraphs):
-                try:
-                    missing_award_ids.remove(award_id)
-                except KeyError:
-                    LOGGER.info('The award-id %s is mentioned more than once.',
-                                award_id)
-            else:
-                LOGGER.info('Cannot find contract number "%s" in the set "%s".',
-                        award_id, award_ids)
+        missing_award_ids = set(award_ids) - found_award_ids
 
         if missing_award_ids:
-            LOGGER.debug('Missing award-id: %s.', missing_award_ids)
+            LOGGER.info('Cannot find contract numbers %s in fn or ack.',
+                        sorted(missing_award_ids))
             err = StyleError()
             err.message = "Element 'funding-group': This element has occurrences not declared in fn or ack."
             err_list.append(err)
     else:
         LOGGER.debug('No contract numbers found in %s.' % et)
 
-    return message
+    return err_list
 
 
-@plumber.filter
-def doctype(message):
+funding_group = _make_filter(check_funding_group)
+
+
+@check()
+def check_doctype(et, elements):
     """Make sure the DOCTYPE declaration is present.
     """
-    et, err_list = message
+    err_list = []
 
     if not et.docinfo.doctype:
         err = StyleError()
         err.message = "Missing DOCTYPE declaration."
         err_list.append(err)
 
-    return message
+    return err_list
+
+
+doctype = _make_filter(check_doctype)
 
+
+# --------------------------------
+# All checks
+# --------------------------------
+# The checks run by `StyleCheckingPipeline`, in the order their errors
+# are reported.
+STYLE_CHECKS = [check_funding_group, check_doctype]
+
+
+@plumber.filter
+def style_checks(message):
+    """Runs all checks of `STYLE_CHECKS` walking the etree only once.
+    """
+    et, err_list = message
+    err_list.extend(run_checks(et, STYLE_CHECKS))
+    return message
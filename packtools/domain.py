@@ -8,9 +8,18 @@ Examples are: XMLValidator and XMLPacker objects, which provide SciELO PS
 validation behaviour and packaging functionality, respectively.
 """
 from __future__ import unicode_literals
+import atexit
 import logging
 from copy import deepcopy
 import os
+import re
+import shutil
+import hashlib
+import contextlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 try:
     import reprlib
 except ImportError:
@@ -73,33 +82,579 @@ def _init_sps_version(xml_et, supported_versions=None):
         return version_from_xml
 
 
-def Schematron(file):
-    with open(file, mode='rb') as fp:
-        xmlschema_doc = etree.parse(fp)
+# Directory where compiled schematron schemas are persisted across processes.
+# The on-disk cache can be disabled by setting `PACKTOOLS_CACHE_DIR` to an
+# empty string.
+CACHE_DIR = os.environ.get('PACKTOOLS_CACHE_DIR', utils.get_default_cache_dir())
+
+# Maximum number of compiled schematron schemas kept in memory.
+SCHEMATRON_CACHE_SIZE = 32
+
+# Maximum number of validation status of XMLs kept in memory by
+# `HTMLGenerator.parse`.
+VALIDITY_CACHE_SIZE = 1024
+
+# Must be incremented whenever the layout of the cached files changes.
+SCHEMATRON_CACHE_VERSION = 1
+
+SCHEMATRON_NS = 'http://purl.oclc.org/dsdl/schematron'
+
+# Named sets of phases of the SPS schematron, to restrict the validation to
+# parts of the documents. See `XMLValidator`.
+SCHEMATRON_PROFILES = {
+    'metadata-only': (
+        'phase.journal-id', 'phase.journal-title-group', 'phase.publisher',
+        'phase.issn', 'phase.article-attrs', 'phase.article-categories',
+        'phase.subj-group', 'phase.article-id', 'phase.fpage_or_elocation-id',
+        'phase.aff', 'phase.aff_contenttypes', 'phase.aff_country',
+        'phase.named-content_attrs', 'phase.contrib-id', 'phase.kwd-group_lang',
+        'phase.counts', 'phase.pub-date', 'phase.volume', 'phase.supplement',
+        'phase.history', 'phase.product', 'phase.license',
+        'phase.funding-group', 'phase.correction', 'phase.in-brief',
+    ),
+    'references-only': (
+        'phase.ref', 'phase.element-citation', 'phase.person-group',
+        'phase.source', 'phase.chapter-title', 'phase.month', 'phase.size',
+        'phase.issue',
+    ),
+}
+
+
+def _resolve_phases(phases, declared):
+    """Replaces the names of profiles in `phases` by their phases.
+
+    The profiles span all the SPS versions, so their phases that are not in
+    `declared`, the ids of the phases of the schema, are left out. Any other
+    phase is kept, to be reported if unknown.
+    """
+    resolved = []
+    for phase in phases:
+        if phase in SCHEMATRON_PROFILES:
+            resolved.extend(profile_phase
+                            for profile_phase in SCHEMATRON_PROFILES[phase]
+                            if profile_phase in declared)
+        else:
+            resolved.append(phase)
+
+    return resolved
+
+
+# Patterns of the SPS schematron validated by `XMLValidator.triage` before the
+# whole schema. The cost of each pattern is roughly the same, so these are
+# the ones most frequently violated by the submitted documents.
+TRIAGE_PATTERNS = (
+    'journal-id_has_publisher-id',
+    'license',
+    'license_attributes',
+    'aff_country-attrs',
+    'month',
+    'element-citation_publication-type-values',
+    'ext-link_href_values',
+    'xref-reftype-values',
+)
+
+
+class _PrecompiledSchematron(isoschematron.Schematron):
+    """`isoschematron.Schematron` built from an already compiled validator XSLT.
+
+    The ISO skeleton steps (include, expand and compile) are bypassed by
+    overriding the `_compile` customization point.
+
+    :param validator_xslt: etree._ElementTree of the validator XSLT.
+    """
+    def __init__(self, validator_xslt):
+        self._precompiled_xslt = validator_xslt
+        super(_PrecompiledSchematron, self).__init__(
+                etree.Element('{%s}schema' % SCHEMATRON_NS),
+                include=False, expand=False, validate_schema=False,
+                store_xslt=True, store_report=True)
+
+    def _compile(self, schematron, **kwargs):
+        return self._precompiled_xslt
+
+
+def _iter_schematron_sources(xmlschema_doc):
+    """Yields the paths of the schematron schema and all its inclusions,
+    including the ones of the included files.
+    """
+    base_url = xmlschema_doc.docinfo.URL
+    yield base_url
+
+    seen = set([os.path.abspath(base_url)])
+    pending = [(base_url, xmlschema_doc)]
+    while pending:
+        url, doc = pending.pop(0)
+        for include in doc.iter('{%s}include' % SCHEMATRON_NS):
+            href = include.attrib.get('href', '')
+            path = os.path.join(os.path.dirname(url), href)
+            if os.path.abspath(path) in seen:
+                continue
+
+            seen.add(os.path.abspath(path))
+            yield path
+
+            try:
+                pending.append((path, etree.parse(path)))
+            except (IOError, OSError, etree.XMLSyntaxError):
+                # the schema cannot be compiled anyway
+                pass
+
+
+def _schematron_cache_key(xmlschema_doc):
+    """Computes the key for the compiled version of `xmlschema_doc`.
+
+    The key is based on the contents of the schema and its inclusions and
+    on the versions of lxml and libxslt.
+    """
+    key = hashlib.sha1()
+    for value in (SCHEMATRON_CACHE_VERSION, etree.LXML_VERSION,
+                  etree.LIBXSLT_VERSION):
+        key.update(repr(value).encode('utf-8'))
+
+    if xmlschema_doc.docinfo.URL is None:
+        # schemas built in memory, as the composed ones, have no inclusions.
+        key.update(etree.tostring(xmlschema_doc))
+        return key.hexdigest()
+
+    for source in _iter_schematron_sources(xmlschema_doc):
+        try:
+            with open(source, mode='rb') as fp:
+                key.update(fp.read())
+        except (IOError, OSError):
+            key.update(source.encode('utf-8'))
+
+    return key.hexdigest()
+
+
+def _get_schematron_cache_path(xmlschema_doc, cache_dir):
+    return os.path.join(cache_dir,
+            'schematron-v%s' % SCHEMATRON_CACHE_VERSION,
+            _schematron_cache_key(xmlschema_doc) + '.xslt')
+
+
+def _compile_schematron(xmlschema_doc, cache_dir):
+    """Returns an instance of `isoschematron.Schematron`, using the compiled
+    validator from `cache_dir` if available.
+    """
+    cached_path = _get_schematron_cache_path(xmlschema_doc, cache_dir)
+
+    if os.path.exists(cached_path):
+        try:
+            return _PrecompiledSchematron(etree.parse(cached_path))
+        except (etree.XMLSyntaxError, etree.XSLTParseError) as exc:
+            LOGGER.warning('Ignoring corrupted cache entry %s: %s',
+                           cached_path, exc)
+
+    schematron = isoschematron.Schematron(xmlschema_doc, store_xslt=True,
+                                          store_report=True)
+    try:
+        utils.write_file_atomically(cached_path,
+                etree.tostring(schematron.validator_xslt))
+    except (IOError, OSError) as exc:
+        LOGGER.warning('Could not write the cache entry %s: %s',
+                       cached_path, exc)
+
+    return schematron
+
+
+def Schematron(file, cache_dir=None, patterns=None, phases=None):
+    """Returns an instance of `isoschematron.Schematron` for `file`.
+
+    The compiled validator is persisted at `cache_dir`, so subsequent calls,
+    even on different processes, load it instead of compiling the schema
+    again. Within the same process, the returned instances are kept in a
+    bounded LRU cache keyed by the file path, size and modification time.
+
+    The validation may be restricted to some patterns, selected by their ids
+    or by the phases of the schema. One validator is compiled and cached for
+    each selection. The pattern ids unknown to the schema are ignored, but
+    ValueError is raised if no pattern is selected or if any of the phases
+    is unknown.
+
+    :param file: Path to the schematron file.
+    :param cache_dir: (optional) Directory of the on-disk cache. The default
+                      value is set by env var `PACKTOOLS_CACHE_DIR`.
+    :param patterns: (optional) ids of the patterns to be validated.
+    :param phases: (optional) ids of the phases whose patterns are validated.
+    """
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+
+    cache = utils.setdefault(Schematron, 'cache',
+            lambda: utils.LRUCache(SCHEMATRON_CACHE_SIZE))
+
+    if patterns is not None:
+        patterns = frozenset(patterns)
+    if phases is not None:
+        phases = frozenset(phases)
+
+    cache_key = _file_cache_key(file) + (cache_dir, patterns, phases)
+
+    schematron = cache.get(cache_key)
+    if schematron is None:
+        with open(file, mode='rb') as fp:
+            xmlschema_doc = etree.parse(fp)
+
+        if patterns is not None or phases is not None:
+            xmlschema_doc = _select_patterns(xmlschema_doc, patterns or (),
+                                             phases or ())
+
+        schematron = _make_schematron(xmlschema_doc, cache_dir)
+        cache[cache_key] = schematron
+
+    return schematron
+
+
+def _file_cache_key(file):
+    file_stat = os.stat(file)
+    return (os.path.abspath(file), file_stat.st_size, file_stat.st_mtime)
+
+
+def _make_schematron(xmlschema_doc, cache_dir):
+    if cache_dir:
+        return _compile_schematron(xmlschema_doc, cache_dir)
+    else:
+        return isoschematron.Schematron(xmlschema_doc,
+                store_xslt=True, store_report=True)
+
+
+def _expand_schematron(xmlschema_doc):
+    """Resolves the inclusions and the abstract patterns of `xmlschema_doc`,
+    as `isoschematron.Schematron` does before compiling a schema.
+    """
+    return isoschematron.iso_abstract_expand(
+            isoschematron.iso_dsdl_include(xmlschema_doc))
+
+
+def _sch_tag(name):
+    return '{%s}%s' % (SCHEMATRON_NS, name)
+
+
+def _select_patterns(xmlschema_doc, patterns, phases=()):
+    """Returns the expanded `xmlschema_doc` keeping only the patterns whose
+    ids are in `patterns` or that are active in `phases`. The phases are
+    removed, as they may refer to the patterns left out.
+
+    A ValueError is raised if any of `phases` is not declared by the schema.
+    """
+    schema = _expand_schematron(xmlschema_doc).getroot()
+    schema.attrib.pop('defaultPhase', None)
+
+    selected_ids = set(patterns)
+    declared_phases = set()
+    for phase in schema.findall(_sch_tag('phase')):
+        declared_phases.add(phase.get('id'))
+        if phase.get('id') in phases:
+            selected_ids.update(active.get('pattern')
+                                for active in phase.iter(_sch_tag('active')))
+
+    unknown_phases = set(phases) - declared_phases
+    if unknown_phases:
+        raise ValueError('The phases %s are not declared by the schema' %
+                         ', '.join(sorted(unknown_phases)))
+
+    selected = 0
+    for elem in schema.findall(_sch_tag('phase')) + schema.findall(_sch_tag('pattern')):
+        if elem.tag == _sch_tag('pattern') and elem.get('id') in selected_ids:
+            selected += 1
+        else:
+            schema.remove(elem)
+
+    if not selected:
+        raise ValueError('None of the patterns or phases %s is declared by '
+                         'the schema' % ', '.join(sorted(set(patterns) |
+                                                         set(phases))))
 
-    return isoschematron.Schematron(xmlschema_doc)
+    return schema.getroottree()
 
 
-def StdSchematron(schema_name):
+def _compose_schematron(schemas):
+    """Merges the schematron schemas into a single one.
+
+    The namespaces, variables and foreign elements (e.g. ``xsl:key``) are
+    merged, and a ValueError is raised if their names are bound to different
+    definitions. Only the phases of the first schema are kept. A pattern whose
+    id is already in use is renamed to ``<schema label>.<id>``, where the label
+    is the file name of its schema without the extension.
+
+    Returns a 2-tuple in the form: (<composed etree>, <pattern sources>),
+    where the pattern sources is a dict mapping the ids of the patterns of the
+    composed schema to the paths of the schemas they came from.
+
+    :param schemas: list of 2-tuples in the form: (<path>, <etree>).
+    """
+    query_bindings = []
+    preamble, phases, patterns, diagnostics = [], [], [], []
+    namespaces = OrderedDict()
+    declarations = OrderedDict()
+    diagnostic_ids = set()
+    pattern_sources = OrderedDict()
+
+    for index, (file, xmlschema_doc) in enumerate(schemas):
+        schema = _expand_schematron(xmlschema_doc).getroot()
+        label = re.sub(r'[^\w.-]', '_',
+                       os.path.splitext(os.path.basename(file))[0])
+        query_bindings.append(schema.get('queryBinding', 'xslt').lower())
+        if index == 0:
+            schema_attrib = dict(schema.attrib)
+
+        for elem in schema.iterchildren(etree.Element):
+            if elem.tag == _sch_tag('ns'):
+                prefix = elem.get('prefix')
+                if prefix not in namespaces:
+                    namespaces[prefix] = elem
+                elif namespaces[prefix].get('uri') != elem.get('uri'):
+                    raise ValueError('Namespace prefix %s is bound to '
+                                     'different uris' % prefix)
+
+            elif elem.tag == _sch_tag('pattern'):
+                pattern_id = elem.get('id')
+                if pattern_id is None or pattern_id in pattern_sources:
+                    pattern_id = '%s.%s' % (label, pattern_id or len(patterns))
+                    if pattern_id in pattern_sources:
+                        raise ValueError('Duplicated pattern id %s' % pattern_id)
+                    elem.set('id', pattern_id)
+
+                pattern_sources[pattern_id] = file
+                patterns.append(elem)
+
+            elif elem.tag == _sch_tag('diagnostics'):
+                for diagnostic in elem.iterchildren(etree.Element):
+                    if diagnostic.get('id') in diagnostic_ids:
+                        raise ValueError('Duplicated diagnostic id %s' %
+                                         diagnostic.get('id'))
+                    diagnostic_ids.add(diagnostic.get('id'))
+                    diagnostics.append(diagnostic)
+
+            elif elem.tag in (_sch_tag('phase'), _sch_tag('title'),
+                              _sch_tag('p')):
+                if index == 0:
+                    (phases if elem.tag == _sch_tag('phase')
+                     else preamble).append(elem)
+
+            else:
+                # variables and foreign elements
+                name = elem.get('name') or len(declarations)
+                if (elem.tag, name) not in declarations:
+                    declarations[(elem.tag, name)] = elem
+                elif (etree.tostring(declarations[(elem.tag, name)],
+                                     with_tail=False) !=
+                      etree.tostring(elem, with_tail=False)):
+                    raise ValueError('%s is defined by more than one '
+                                     'schema' % name)
+
+    if set(query_bindings) <= set(['xslt', 'exslt']):
+        if 'exslt' in query_bindings:
+            schema_attrib['queryBinding'] = 'exslt'
+    elif len(set(query_bindings)) > 1:
+        raise ValueError('Incompatible query bindings: %s' %
+                         ', '.join(sorted(set(query_bindings))))
+
+    composed = etree.Element(_sch_tag('schema'), schema_attrib,
+                             nsmap={None: SCHEMATRON_NS})
+    # the order of the elements is prescribed by the schematron grammar
+    composed.extend(elem for elem in preamble if elem.tag == _sch_tag('title'))
+    composed.extend(namespaces.values())
+    composed.extend(elem for elem in preamble if elem.tag == _sch_tag('p'))
+    composed.extend(declarations.values())
+    composed.extend(phases)
+    composed.extend(patterns)
+    if diagnostics:
+        etree.SubElement(composed, _sch_tag('diagnostics')).extend(diagnostics)
+
+    return etree.ElementTree(composed), pattern_sources
+
+
+def CompositeSchematron(files, cache_dir=None):
+    """Returns an instance of `isoschematron.Schematron` that validates
+    against all schematron schemas in `files` at once.
+
+    The schemas are merged into a single one, so the document is validated by
+    only one XSLT run that produces only one validation report. The errors
+    keep the order of the validations of each schema in `files`, and the
+    attribute ``pattern_sources`` of the returned instance maps each pattern
+    id to the path of the schema it came from. See :func:`_compose_schematron`
+    for the details on how the schemas are merged.
+
+    The returned instances are cached the same way :func:`Schematron` does.
+
+    :param files: list of paths to the schematron files.
+    :param cache_dir: (optional) Directory of the on-disk cache.
+    """
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+
+    cache = utils.setdefault(Schematron, 'cache',
+            lambda: utils.LRUCache(SCHEMATRON_CACHE_SIZE))
+
+    cache_key = (tuple(_file_cache_key(file) for file in files), cache_dir)
+
+    schematron = cache.get(cache_key)
+    if schematron is None:
+        schemas = []
+        for file in files:
+            with open(file, mode='rb') as fp:
+                schemas.append((file, etree.parse(fp)))
+
+        xmlschema_doc, pattern_sources = _compose_schematron(schemas)
+        schematron = _make_schematron(xmlschema_doc, cache_dir)
+        schematron.pattern_sources = pattern_sources
+        cache[cache_key] = schematron
+
+    return schematron
+
+
+def warm_schematron_cache(files=None, cache_dir=None, prune=False):
+    """Compiles the schematron schemas and store them at the on-disk cache.
+
+    Returns the list of paths of the schemas.
+
+    :param files: (optional) list of paths to schematron files. The schemas
+                  bundled with packtools are used by default.
+    :param cache_dir: (optional) Directory of the on-disk cache.
+    :param prune: (optional) removes from the cache all other compiled
+                  schemas, e.g. the ones of older versions of the schemas in
+                  `files`, of previous cache layouts, or compiled for
+                  selections of patterns, that are compiled again on demand.
+    """
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+
+    if files is None:
+        files = sorted(path for path in catalogs.SCHEMAS.values()
+                       if path.endswith('.sch'))
+
+    current_paths = set()
+    for file in files:
+        Schematron(file, cache_dir=cache_dir)
+        if cache_dir:
+            current_paths.add(_get_schematron_cache_path(etree.parse(file),
+                                                         cache_dir))
+
+    if prune and cache_dir:
+        _prune_schematron_cache(cache_dir, current_paths)
+
+    return list(files)
+
+
+def load_validators(extra_schematron=None, phases=None):
+    """Loads the DTDs and the schematron schemas used by
+    :class:`XMLValidator`, e.g. once per worker process, so that the first
+    documents validated do not pay for it.
+
+    :param extra_schematron: (optional) path to an extra schematron file.
+    :param phases: (optional) only the SPS schemas restricted to these phases
+                   are loaded. See :class:`XMLValidator`.
+    """
+    for public_id in catalogs.DTD_PUBLIC_IDS:
+        StdDTD(public_id)
+
+    versions = [version for version in CURRENTLY_SUPPORTED_VERSIONS
+                if version in catalogs.SCHEMAS]
+    if phases:
+        schemas = []
+        for version in versions:
+            StdSchematron(version, phases=phases)
+    else:
+        schemas = [catalogs.SCHEMAS[version] for version in versions]
+    if extra_schematron:
+        schemas.append(extra_schematron)
+
+    warm_schematron_cache(schemas)
+
+
+def _prune_schematron_cache(cache_dir, current_paths):
+    """Removes the files of the on-disk cache at `cache_dir` but
+    `current_paths`.
+    """
+    current_dir = 'schematron-v%s' % SCHEMATRON_CACHE_VERSION
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if not name.startswith('schematron-v') or not os.path.isdir(path):
+            continue
+
+        if name != current_dir:
+            LOGGER.info('removing the cache of old layout %s', path)
+            shutil.rmtree(path, ignore_errors=True)
+            continue
+
+        for entry in os.listdir(path):
+            entry_path = os.path.join(path, entry)
+            # the temporary files may be being written by other processes
+            if entry.endswith('.xslt') and entry_path not in current_paths:
+                LOGGER.info('removing the cache entry %s', entry_path)
+                try:
+                    os.remove(entry_path)
+                except OSError as exc:
+                    LOGGER.warning('Could not remove the cache entry %s: %s',
+                                   entry_path, exc)
+
+
+def StdSchematron(schema_name, phases=None):
     """Returns an instance of `isoschematron.Schematron`.
 
     A standard schematron is one bundled with packtools.
-    The returned instance is cached due to performance reasons.
+    The returned instance is cached due to performance reasons, sharing
+    the same cache used by :func:`Schematron`.
 
     :param schema_name: The logical name of schematron file in the package `catalogs`.
+    :param phases: (optional) ids of phases or names of profiles declared at
+                   `SCHEMATRON_PROFILES`. See :func:`Schematron`.
+    """
+    schema_path = _get_schema_path(schema_name)
+    if phases is not None:
+        phases = _resolve_phases(phases, _get_phases(schema_path))
+
+    return Schematron(schema_path, phases=phases)
+
+
+def _get_phases(file):
+    """Returns a dict mapping the ids of the phases declared by the
+    schematron `file` to the ids of their active patterns.
+    """
+    cache = utils.setdefault(_get_phases, 'cache', lambda: {})
+    cache_key = _file_cache_key(file)
+    if cache_key not in cache:
+        with open(file, mode='rb') as fp:
+            schema = _expand_schematron(etree.parse(fp))
+
+        cache[cache_key] = dict(
+                (phase.get('id'), frozenset(active.get('pattern') for active
+                                            in phase.iter(_sch_tag('active'))))
+                for phase in schema.iter(_sch_tag('phase')))
+
+    return cache[cache_key]
+
+
+def _get_schema_path(schema_name):
+    try:
+        return catalogs.SCHEMAS[schema_name]
+    except KeyError:
+        raise ValueError('Unknown schema %s' % (schema_name,))
+
+
+def StdDTD(public_id):
+    """Returns an instance of `etree.DTD`.
+
+    A standard DTD is one bundled with packtools, and is identified by
+    its public id. The returned instance is cached due to performance
+    reasons, and is shared by all documents declaring the same public id.
+
+    :param public_id: The public id of the DTD, as in the DOCTYPE declaration.
     """
-    cache = utils.setdefault(StdSchematron, 'cache', lambda: {})
+    cache = utils.setdefault(StdDTD, 'cache', lambda: {})
 
-    if schema_name in cache:
-        return cache[schema_name]
+    if public_id in cache:
+        return cache[public_id]
     else:
         try:
-            schematron = Schematron(catalogs.SCHEMAS[schema_name])
+            dtd_name = catalogs.DTD_PUBLIC_IDS[public_id]
         except KeyError:
-            raise ValueError('Unknown schema %s' % (schema_name,))
+            raise ValueError('Unknown DTD public id %s' % (public_id,))
 
-        cache[schema_name] = schematron
-        return schematron
+        dtd = etree.DTD(catalogs.SCHEMAS[dtd_name])
+        cache[public_id] = dtd
+        return dtd
 
 
 def XSLT(xslt_name):
@@ -122,9 +677,63 @@ def XSLT(xslt_name):
         return xslt
 
 
+def _get_xslt_name(xslt):
+    """Returns the name of `xslt`, if it was returned by :func:`XSLT`, or
+    None otherwise.
+    """
+    for xslt_name, cached_xslt in utils.setdefault(XSLT, 'cache', lambda: {}).items():
+        if cached_xslt is xslt:
+            return xslt_name
+
+    return None
+
+
+def _get_xslt_fingerprint(xslt):
+    """Identifies the XSLT file `xslt` was compiled from, and the versions of
+    the libraries that run it.
+
+    :param xslt: `etree.XSLT` instance returned by :func:`XSLT`.
+    """
+    xslt_name = _get_xslt_name(xslt)
+    if xslt_name is None:
+        raise ValueError('Unknown xslt %s' % (xslt,))
+
+    fingerprints = utils.setdefault(_get_xslt_fingerprint, 'cache', lambda: {})
+    if xslt_name not in fingerprints:
+        fingerprint = hashlib.sha1()
+        for value in (etree.LXML_VERSION, etree.LIBXSLT_VERSION):
+            fingerprint.update(repr(value).encode('utf-8'))
+        with open(catalogs.XSLTS[xslt_name], mode='rb') as fp:
+            fingerprint.update(fp.read())
+
+        fingerprints[xslt_name] = fingerprint.hexdigest()
+
+    return fingerprints[xslt_name]
+
+
+def _get_validity(et):
+    """Tells whether `et` is valid according to the SPS rules. The status
+    is memoized by the content of `et`.
+    """
+    cache = utils.setdefault(_get_validity, 'cache',
+            lambda: utils.LRUCache(VALIDITY_CACHE_SIZE))
+    key = hashlib.sha1(etree.tostring(et)).hexdigest()
+
+    if key not in cache:
+        is_valid, _ = XMLValidator.parse(et).validate_all()
+        cache[key] = bool(is_valid)
+
+    return cache[key]
+
+
 #--------------------------------
 # adapters for etree._ElementTree
 #--------------------------------
+@contextlib.contextmanager
+def _untimed():
+    yield
+
+
 class XMLValidator(object):
     """Adapter that performs SPS validations.
 
@@ -136,26 +745,64 @@ class XMLValidator(object):
 
     :param file: etree._ElementTree instance.
     :param sps_version: the version of the SPS that will be the basis for validation.
-    :param dtd: (optional) etree.DTD instance. If not provided, we try the external DTD.
+    :param dtd: (optional) etree.DTD instance. If not provided, we try the DTD
+                bundled with packtools for the doctype public id, and then the
+                external DTD.
     :param extra_schematron: (optional) extra schematron schema.
+    :param timing: (optional) record the time spent on each validation stage
+                   at ``timings``. The stages are ``dtd``, ``pipeline``,
+                   ``schematron``, ``extra_schematron``, ``triage`` and
+                   ``annotate``.
+    :param concurrent: (optional) run the validation stages concurrently
+                       on a pool of threads. See :meth:`validate_all`.
+    :param merge_schematron: (optional) compose the SPS schematron and the
+                             `extra_schematron` into a single schema, so the
+                             document is validated by both at once. The errors
+                             are attributed to their schemas by the attribute
+                             ``schema``. See :func:`CompositeSchematron`.
+    :param phases: (optional) restrict the validation against the SPS
+                   schematron to these phases, that may also be names of
+                   profiles declared at `SCHEMATRON_PROFILES`, e.g.
+                   ``metadata-only``. The `extra_schematron` is not affected,
+                   and cannot be merged if phases are given.
     """
-    def __init__(self, file, sps_version, dtd=None, extra_schematron=None):
+    def __init__(self, file, sps_version, dtd=None, extra_schematron=None,
+                 timing=False, concurrent=False, merge_schematron=False,
+                 phases=None):
         assert isinstance(file, etree._ElementTree)
 
         self.lxml = file
         self.sps_version = sps_version
         self.allowed_public_ids = _get_public_ids(self.sps_version)
         self.doctype = self.lxml.docinfo.doctype
-        self.dtd = dtd or self.lxml.docinfo.externalDTD
         self.source_url = self.lxml.docinfo.URL
         self.public_id = self.lxml.docinfo.public_id
         self.encoding = self.lxml.docinfo.encoding
 
+        if dtd is None and self.public_id in catalogs.DTD_PUBLIC_IDS:
+            dtd = StdDTD(self.public_id)
+        self.dtd = dtd or self.lxml.docinfo.externalDTD
+
         # Load schematron schema based on sps version. Can raise ValueError
-        self.schematron = StdSchematron(self.sps_version)
+        if extra_schematron and merge_schematron:
+            if phases is not None:
+                raise ValueError('The schematron schemas cannot be merged '
+                                 'if phases are given')
 
-        # Load user-provided schematron schema
-        if extra_schematron:
+            self.schematron = CompositeSchematron(
+                    [_get_schema_path(self.sps_version), extra_schematron])
+        else:
+            if phases is not None:
+                phases = _resolve_phases(
+                        phases, _get_phases(_get_schema_path(self.sps_version)))
+            self.schematron = StdSchematron(self.sps_version, phases=phases)
+
+        # The phases of the SPS schematron validated, or None for all.
+        self.phases = phases
+
+        # Load user-provided schematron schema. The compiled schema is
+        # shared among all instances.
+        if extra_schematron and not merge_schematron:
             self.extra_schematron = Schematron(extra_schematron)
         else:
             self.extra_schematron = None
@@ -166,6 +813,11 @@ class XMLValidator(object):
         # Cache of validation results
         self._validation_errors = {'dtd': (), 'style': ()}
 
+        # Time spent on each validation stage, if requested
+        self.timings = utils.Timings() if timing else None
+
+        self.concurrent = concurrent
+
     @classmethod
     def parse(cls, file, no_doctype=False, sps_version=None,
             supported_sps_versions=None, **kwargs):
@@ -226,31 +878,85 @@ class XMLValidator(object):
             def make_error_log():
                 return [style_errors.SchemaStyleError(err) for err in self.dtd.error_log]
 
-            result = self.dtd.validate(self.lxml)
-            errors = make_error_log()
+            with self._measure('dtd'):
+                result = self.dtd.validate(self.lxml)
+                errors = make_error_log()
             self._validation_errors['dtd'] = result, errors
 
         return self._validation_errors['dtd']
 
+    def _validate_schematron(self, schematron, stage):
+        with self._measure(stage):
+            result = schematron.validate(self.lxml)
+            errors = style_errors.make_schematron_errors(schematron)
+
+        return result, errors
+
     def _validate_sch(self):
         """Validate the source XML against SPS-Style Schematron.
 
         Returns a tuple comprising the validation status and the errors list.
         """
-        def make_error_log(schematron):
-            err_log = schematron.error_log
-            return [style_errors.SchematronStyleError(err) for err in err_log]
-
-        result = self.schematron.validate(self.lxml)
-        errors = make_error_log(self.schematron)
+        result, errors = self._validate_schematron(self.schematron,
+                                                   'schematron')
 
         if self.extra_schematron:
-            extra_result = self.extra_schematron.validate(self.lxml)  # run
+            extra_result, extra_errors = self._validate_schematron(
+                    self.extra_schematron, 'extra_schematron')
             result = result and extra_result
-            errors += make_error_log(self.extra_schematron)
+            errors += extra_errors
 
         return result, errors
 
+    def _run_pipeline(self):
+        with self._measure('pipeline'):
+            return next(self.ppl.run(self.lxml, rewrap=True))
+
+    def _validate_concurrently(self):
+        """Runs the DTD validation, the python checks pipeline and the
+        schematron validations concurrently, and caches their results as
+        :meth:`validate` and :meth:`validate_style` do.
+
+        lxml releases the GIL while libxml2 and libxslt are validating, and
+        the tree is only read by the stages, so they can run in parallel.
+
+        Unlike :meth:`HTMLGenerator.generate_all`, the shared schematron
+        instances are not copied for each thread: each of them is run by a
+        single stage while the calling thread waits, so none is run by two
+        threads at the same time, as long as the validators that share them
+        are not used concurrently, the same condition of the sequential
+        validation. lxml binds no state of a stylesheet to the
+        thread that created it, only to the last run, which is read by the
+        same stage right after the validation.
+        """
+        def validate_dtd():
+            try:
+                return self.validate()
+            except exceptions.UndefinedDTDError as exc:
+                return exc
+
+        stages = [validate_dtd, self._run_pipeline,
+                  lambda: self._validate_schematron(self.schematron,
+                                                    'schematron')]
+        if self.extra_schematron:
+            stages.append(lambda: self._validate_schematron(
+                self.extra_schematron, 'extra_schematron'))
+
+        # the stages do not use the pool, so it cannot deadlock even when
+        # shared by validators running on several threads.
+        results = _get_validation_pool().map(lambda stage: stage(), stages)
+
+        # the errors are merged in the same order of the sequential run
+        pipeline_errors, sch_results = results[1], results[2:]
+        errors = list(pipeline_errors)
+        for _, sch_errors in sch_results:
+            errors += sch_errors
+
+        self._validation_errors['style'] = not bool(errors), errors
+
+        if isinstance(results[0], exceptions.UndefinedDTDError):
+            raise results[0]
+
     def validate_style(self):
         """Validate the source XML against SPS-Style Tagging guidelines.
 
@@ -258,7 +964,7 @@ class XMLValidator(object):
         """
         if len(self._validation_errors['style']) == 0:
             def make_error_log():
-                errors = next(self.ppl.run(self.lxml, rewrap=True))
+                errors = self._run_pipeline()
                 errors += self._validate_sch()[1]
                 return errors
 
@@ -276,9 +982,16 @@ class XMLValidator(object):
         is raised. After that, the XML is validated against the SciELO style
         (calling :meth:`validate_style`).
 
+        If the instance was created with ``concurrent=True``, all validation
+        stages are run at the same time by a pool of threads. The results
+        are the same, in the same order, of the sequential run.
+
         :param fail_fast: (optional) raise ``TypeError`` if the DTD has not been loaded.
         """
         try:
+            if self.concurrent and not self._validation_errors['style']:
+                self._validate_concurrently()
+
             v_result, v_errors = self.validate()
 
         except exceptions.UndefinedDTDError:
@@ -295,6 +1008,65 @@ class XMLValidator(object):
 
         return val_status, val_errors
 
+    def triage(self):
+        """Tells whether the document is valid, stopping at the first
+        validation stage that fails.
+
+        The stages are run from the cheapest to the most expensive: the
+        DOCTYPE public id, the python checks pipeline, the DTD, the schematron
+        patterns listed at `TRIAGE_PATTERNS` and, finally, the schematron
+        schemas. The DTD stage is skipped if the DTD cannot be loaded. If the
+        validation is restricted to some phases, only the triage patterns
+        active in them are validated, and that stage is skipped if none is.
+
+        Returns a tuple comprising the validation status and the errors of
+        the failing stage. The status is None if the document passed all
+        stages but the DTD could not be loaded.
+        """
+        if self.doctype and self.public_id not in self.allowed_public_ids:
+            err = style_errors.StyleError()
+            err.message = 'Unsupported DOCTYPE public id: %s' % self.public_id
+            return False, [err]
+
+        pipeline_errors = self._run_pipeline()
+        if pipeline_errors:
+            return False, pipeline_errors
+
+        try:
+            dtd_result, dtd_errors = self.validate()
+        except exceptions.UndefinedDTDError:
+            dtd_result = None
+        else:
+            if not dtd_result:
+                return False, dtd_errors
+
+        schema_path = _get_schema_path(self.sps_version)
+        patterns = TRIAGE_PATTERNS
+        if self.phases is not None:
+            # only the patterns validated by `validate_style` are triaged.
+            phases = _get_phases(schema_path)
+            patterns = [pattern for pattern in TRIAGE_PATTERNS
+                        if any(pattern in phases.get(phase, ())
+                               for phase in self.phases)]
+
+        if patterns:
+            triage_schematron = Schematron(schema_path, patterns=patterns)
+            result, errors = self._validate_schematron(triage_schematron,
+                                                       'triage')
+            if not result:
+                return False, errors
+
+        # the python checks have passed, so the schematron errors are all
+        # the style errors.
+        if not self._validation_errors['style']:
+            self._validation_errors['style'] = self._validate_sch()
+
+        result, errors = self._validation_errors['style']
+        if not result:
+            return False, errors
+
+        return dtd_result, []
+
     def _annotate_error(self, element, error):
         """Add an annotation prior to `element`, with `error` as the content.
 
@@ -313,15 +1085,22 @@ class XMLValidator(object):
         The errors list is generated as the result of calling :meth:`validate_all`.
         """
         status, errors = self.validate_all(fail_fast=fail_fast)
+
+        with self._measure('annotate'):
+            return self._annotate_errors(status, errors)
+
+    def _annotate_errors(self, status, errors):
         mutating_xml = deepcopy(self.lxml)
 
         if status is True:
             return mutating_xml
 
+        index = style_errors.ElementIndex(mutating_xml)
         err_pairs = []
         for error in errors:
             try:
-                err_element = error.get_apparent_element(mutating_xml)
+                err_element = error.get_apparent_element(mutating_xml,
+                                                         index=index)
             except ValueError:
                 LOGGER.info('Could not locate the element name in: %s', error.message)
                 err_element = mutating_xml.getroot()
@@ -333,6 +1112,15 @@ class XMLValidator(object):
 
         return mutating_xml
 
+    def _measure(self, stage):
+        """Context manager that records the time spent on `stage`, if the
+        timing is enabled.
+        """
+        if self.timings is None:
+            return _untimed()
+        else:
+            return self.timings.measure(stage)
+
     def __repr__(self):
         arg_names = [u'lxml', u'sps_version', u'dtd']
         arg_values = [reprlib.repr(getattr(self, arg)) for arg in arg_names]
@@ -344,6 +1132,15 @@ class XMLValidator(object):
         return '<XMLValidator object at 0x%x (%s)>' % (
                 id(self), u', '.join(attrib_args))
 
+    @property
+    def element_index(self):
+        """Index of the elements of the source XML, used to locate errors.
+
+        The index is built on the first access.
+        """
+        return utils.setdefault(self, '_element_index',
+                lambda: style_errors.ElementIndex(self.lxml))
+
     @property
     def meta(self):
         """Article metadata.
@@ -383,6 +1180,81 @@ class XMLValidator(object):
         return [(asset, asset in base) for asset in self.assets]
 
 
+# Number of threads used by `HTMLGenerator.generate_all`.
+HTML_RENDER_THREADS = multiprocessing.cpu_count()
+
+# Number of threads used by `XMLValidator` with ``concurrent=True``: one for
+# the DTD, one for the checks pipeline and one for each schematron schema.
+VALIDATION_THREADS = 4
+
+_thread_data = threading.local()
+_thread_pools_lock = threading.Lock()
+
+
+def _get_thread_xslt(xslt_name):
+    """Returns the copy of the XSLT `xslt_name`, as returned by :func:`XSLT`,
+    owned by the current thread.
+
+    An `etree.XSLT` instance may be used by any thread, but not by many at
+    the same time, since lxml keeps the state of the last transformation,
+    e.g. its error log, on the instance.
+    """
+    copies = utils.setdefault(_thread_data, 'xslts', lambda: {})
+    if xslt_name not in copies:
+        copies[xslt_name] = deepcopy(XSLT(xslt_name))
+
+    return copies[xslt_name]
+
+
+def _get_thread_pool(name, processes):
+    """Returns the pool of `processes` threads identified by `name`.
+
+    The pools live as long as the process, so the threads are started only
+    once. A new pool is created on forked processes, which do not inherit
+    the threads.
+    """
+    with _thread_pools_lock:
+        pools = utils.setdefault(_get_thread_pool, 'pools', lambda: {})
+        pid = os.getpid()
+        if any(pool_pid != pid for pool_pid, _ in pools):
+            pools.clear()
+        if (pid, name) not in pools:
+            pools[(pid, name)] = ThreadPool(processes)
+
+        return pools[(pid, name)]
+
+
+def _close_thread_pools():
+    """Waits for the threads of the pools of this process to finish.
+    """
+    with _thread_pools_lock:
+        pools = utils.setdefault(_get_thread_pool, 'pools', lambda: {})
+        for (pid, _), pool in pools.items():
+            if pid == os.getpid():
+                pool.close()
+                pool.join()
+        pools.clear()
+
+
+# otherwise the pools are torn down after the modules they depend on.
+atexit.register(_close_thread_pools)
+
+
+def _get_render_pool():
+    """Returns the pool of threads used to render HTML.
+
+    Each thread compiles its copies of the XSLTs only once.
+    """
+    return _get_thread_pool('render', HTML_RENDER_THREADS)
+
+
+def _get_validation_pool():
+    """Returns the pool of threads used by :meth:`XMLValidator.validate_all`
+    to run the validation stages concurrently.
+    """
+    return _get_thread_pool('validation', VALIDATION_THREADS)
+
+
 class HTMLGenerator(object):
     """Adapter that generates HTML from SPS XML.
 
@@ -402,31 +1274,65 @@ class HTMLGenerator(object):
     :param file: etree._ElementTree instance.
     :param xslt: (optional) etree.XSLT instance. If not provided, the default XSLT is used.
     :param css: (optional) URI for a CSS file.
+    :param render_cache: (optional) mapping where the HTMLs serialized by
+                         :meth:`render` are stored, e.g.
+                         :class:`packtools.utils.LRUCache` or
+                         :class:`packtools.utils.DirectoryCache`. Only the
+                         XSLTs returned by :func:`XSLT` can be cached. The
+                         lookup happens at :meth:`render`, so a hit does not
+                         save the validation done by :meth:`parse`.
+    :param profile: (optional) :class:`packtools.profiling.XSLTProfile`
+                    instance that runs the transformations, accumulating the
+                    time spent on each template. It must be created with the
+                    same XSLT of the instance.
     """
-    def __init__(self, file, xslt=None, css=None):
+    def __init__(self, file, xslt=None, css=None, render_cache=None,
+                 profile=None):
         assert isinstance(file, etree._ElementTree)
 
         self.lxml = file
         self.xslt = xslt or XSLT('root-html-1.2.xslt')
         self.css = css
+        self.render_cache = render_cache
+        self.profile = profile
+        if render_cache is not None:
+            # can raise ValueError
+            self._xslt_fingerprint = _get_xslt_fingerprint(self.xslt)
 
     @classmethod
-    def parse(cls, file, valid_only=True, **kwargs):
+    def parse(cls, file, valid_only=True, is_valid=None, **kwargs):
         """Factory of HTMLGenerator instances.
 
         If `file` is not an etree instance, it will be parsed using
-        :func:`XML`.
+        :func:`XML`. If it is an :class:`XMLValidator` instance, its etree
+        and its validation results are reused.
 
-        :param file: Path to the XML file, URL, etree or file-object.
+        The validation status of the XMLs validated by this method is memoized
+        by their content, so the same XML is not validated twice.
+
+        :param file: Path to the XML file, URL, etree, file-object or
+                     XMLValidator.
         :param valid_only: (optional) prevents the generation of HTML for invalid XMLs.
+        :param is_valid: (optional) validation status already known, e.g. the
+                         ``is_valid`` of the summary produced by stylechecker.
         """
-        if isinstance(file, etree._ElementTree):
-            et = file
+        if isinstance(file, XMLValidator):
+            validator = file
+            et = validator.lxml
         else:
-            et = utils.XML(file)
+            validator = None
+            if isinstance(file, etree._ElementTree):
+                et = file
+            else:
+                et = utils.XML(file)
 
         if valid_only:
-            is_valid, _ = XMLValidator.parse(et).validate_all()
+            if is_valid is None and validator is not None:
+                # the results are cached by the validator
+                is_valid, _ = validator.validate_all()
+            elif is_valid is None:
+                is_valid = _get_validity(et)
+
             if not is_valid:
                 raise ValueError('The XML is not valid according to SPS rules')
 
@@ -490,11 +1396,32 @@ class HTMLGenerator(object):
             res_html = self.generate(lang)
             yield lang, res_html
 
+    def generate_all(self):
+        """Generates the HTML of all languages concurrently.
+
+        Returns a list of (<lang>, <html>) in the same order of the iteration
+        over the instance. Only the XSLTs returned by :func:`XSLT` are run
+        concurrently, by per-thread copies; the others are run sequentially.
+        """
+        languages = self.languages
+        xslt_name = _get_xslt_name(self.xslt)
+        if (len(languages) < 2 or HTML_RENDER_THREADS < 2 or
+                xslt_name is None or self.profile is not None):
+            return list(self)
+
+        htmls = _get_render_pool().map(
+                lambda lang: self._generate(lang, _get_thread_xslt(xslt_name)),
+                languages)
+        return list(zip(languages, htmls))
+
     def generate(self, lang):
         """Generates the HTML in the language ``lang``.
 
         :param lang: 2-digit ISO 639-1 text string.
         """
+        return self._generate(lang, self.xslt)
+
+    def _get_xslt_params(self, lang):
         main_language = self.language
         if main_language is None:
             raise exceptions.HTMLGenerationError('Main document language is '
@@ -504,12 +1431,56 @@ class HTMLGenerator(object):
             raise ValueError('Unknown language "%s"' % lang)
 
         is_translation = lang != main_language
-        return self.xslt(
-                self.lxml,
-                article_lang=etree.XSLT.strparam(lang),
-                is_translation=etree.XSLT.strparam(str(is_translation)),
-                bibliographic_legend=etree.XSLT.strparam(self._get_bibliographic_legend()),
-                issue_label=etree.XSLT.strparam(self._get_issue_label()),
-                styles_css_path=etree.XSLT.strparam(self.css or ''),
-        )
+        return OrderedDict([
+            ('article_lang', lang),
+            ('is_translation', str(is_translation)),
+            ('bibliographic_legend', self._get_bibliographic_legend()),
+            ('issue_label', self._get_issue_label()),
+            ('styles_css_path', self.css or ''),
+        ])
+
+    def _generate(self, lang, xslt):
+        params = dict((name, etree.XSLT.strparam(value)) for name, value
+                      in self._get_xslt_params(lang).items())
+        if self.profile is not None:
+            return self.profile.run(self.lxml, **params)
+
+        return xslt(self.lxml, **params)
+
+    @utils.cachedmethod
+    def _get_content_hash(self):
+        return hashlib.sha1(etree.tostring(self.lxml)).hexdigest()
+
+    def _get_render_cache_key(self, params):
+        key = hashlib.sha1()
+        for value in [self._get_content_hash(), self._xslt_fingerprint] + [
+                '%s=%s' % item for item in params.items()]:
+            key.update(value.encode('utf-8') + b'\x00')
+
+        return key.hexdigest()
+
+    def render(self, lang):
+        """Generates the HTML in the language ``lang``, serialized as bytes.
+
+        If the instance has a render cache, the HTML is looked up by the
+        content of the XML, the XSLT and its parameters, and it is generated
+        only if missing.
+
+        :param lang: 2-digit ISO 639-1 text string.
+        """
+        params = self._get_xslt_params(lang)
+        if self.render_cache is not None:
+            cache_key = self._get_render_cache_key(params)
+            html = self.render_cache.get(cache_key)
+            if html is not None:
+                return html
+
+        html = etree.tostring(self._generate(lang, self.xslt),
+                              pretty_print=True, encoding='utf-8',
+                              method='html', doctype='<!DOCTYPE html>')
+
+        if self.render_cache is not None:
+            self.render_cache[cache_key] = html
+
+        return html
 
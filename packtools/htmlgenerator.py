@@ -2,12 +2,18 @@
 from __future__ import print_function, unicode_literals
 import argparse
 import sys
+import functools
+import multiprocessing
 import pkg_resources
 import logging
+import time
+import json
+import hashlib
 
 from lxml import etree
 
 import packtools
+from packtools import profiling, exceptions
 
 
 LOGGER = logging.getLogger(__name__)
@@ -19,7 +25,8 @@ class XMLError(Exception):
     """
 
 
-def get_htmlgenerator(xmlpath, no_network, no_checks, css):
+def get_htmlgenerator(xmlpath, no_network, no_checks, css, render_cache=None,
+                      profile=None):
     try:
         parsed_xml = packtools.XML(xmlpath, no_network=no_network)
     except IOError as e:
@@ -28,13 +35,178 @@ def get_htmlgenerator(xmlpath, no_network, no_checks, css):
         raise XMLError('Error reading %s. Syntax error: %s' % (xmlpath, e))
 
     try:
-        generator = packtools.HTMLGenerator.parse(parsed_xml, valid_only=not no_checks, css=css)
+        generator = packtools.HTMLGenerator.parse(parsed_xml, valid_only=not no_checks, css=css,
+                                                  render_cache=render_cache,
+                                                  profile=profile)
     except ValueError as e:
         raise XMLError('Error reading %s. %s.' % (xmlpath, e))
 
     return generator
 
 
+def _init_worker(no_checks):
+    """Loads the HTML XSLT, and the DTDs and schematron schemas needed to
+    validate the XMLs, once per worker process.
+    """
+    packtools.domain.XSLT('root-html-1.2.xslt')
+    if not no_checks:
+        packtools.domain.load_validators()
+
+
+def _get_document_cache_key(data, args):
+    """Identifies the HTMLs generated from the raw bytes `data` of an XML,
+    with the XSLT, the libraries and the command line options in use.
+
+    Unlike the key used by :meth:`packtools.HTMLGenerator.render`, it is
+    computed without parsing or validating the XML.
+    """
+    xslt = packtools.domain.XSLT('root-html-1.2.xslt')
+    key = hashlib.sha1()
+    for value in (packtools.__version__, etree.LIBXML_VERSION,
+                  packtools.domain._get_xslt_fingerprint(xslt),
+                  args.nonetwork, args.nochecks, args.css):
+        key.update(repr(value).encode('utf-8'))
+    key.update(data)
+    return key.hexdigest()
+
+
+def _get_cached_htmls(render_cache, cache_key):
+    """Returns the list of ``(<lang>, <html>)`` stored under `cache_key`, or
+    ``None`` if any of them is missing.
+    """
+    languages = render_cache.get(cache_key)
+    if languages is None:
+        return None
+
+    htmls = []
+    for lang in json.loads(languages.decode('utf-8')):
+        html = render_cache.get('%s.%s' % (cache_key, lang))
+        if html is None:
+            return None
+        htmls.append((lang, html))
+
+    return htmls
+
+
+def _generate_htmls(xml, args):
+    """Returns the list of ``(<lang>, <html>)`` of `xml`.
+    """
+    html_generator = get_htmlgenerator(xml, args.nonetwork, args.nochecks,
+                                       args.css)
+    LOGGER.debug('HTMLGenerator repr: %s' % repr(html_generator))
+
+    return [(lang, html_generator.render(lang))
+            for lang in html_generator.languages]
+
+
+def _process_xml(xml, args):
+    """Generates the HTML of each language of `xml`, writing it to
+    ``<name>.<lang>.html``.
+
+    With ``args.rendercache``, the HTMLs are looked up by the raw bytes of
+    the file before it is parsed, so a hit skips the validation too.
+
+    Returns a 4-tuple in the form:
+    (<xml>, <list of generated files>, <error>, <elapsed time>)
+    """
+    start = time.time()
+    LOGGER.info('starting generation of %s' % (xml,))
+
+    out_fnames = []
+    try:
+        htmls = cache_key = None
+        if args.rendercache and not xml.startswith(('http:', 'https:')):
+            render_cache = packtools.utils.DirectoryCache(args.rendercache)
+            try:
+                with open(xml, 'rb') as fp:
+                    cache_key = _get_document_cache_key(fp.read(), args)
+            except (IOError, OSError):
+                pass  # reported by get_htmlgenerator
+            else:
+                htmls = _get_cached_htmls(render_cache, cache_key)
+
+        if htmls is None:
+            htmls = _generate_htmls(xml, args)
+            if cache_key is not None:
+                for lang, html in htmls:
+                    render_cache['%s.%s' % (cache_key, lang)] = html
+                # stored last, so that a hit always finds every HTML
+                render_cache[cache_key] = json.dumps(
+                        [lang for lang, _ in htmls]).encode('utf-8')
+        else:
+            LOGGER.debug('HTMLs of %s found at the render cache' % (xml,))
+
+        for lang, html in htmls:
+            fname, fext = xml.rsplit('.', 1)
+            out_fname = '.'.join([fname, lang, 'html'])
+
+            with open(out_fname, 'wb') as fp:
+                fp.write(html)
+
+            out_fnames.append(out_fname)
+    except (XMLError, TypeError, exceptions.HTMLGenerationError) as e:
+        error = str(e)
+    else:
+        error = None
+        LOGGER.info('finished generating %s' % (xml,))
+
+    return xml, out_fnames, error, time.time() - start
+
+
+def _process_xmls(xmls, args):
+    """Produces the results of :func:`_process_xml` for each of `xmls`, in
+    the same order.
+
+    When ``args.jobs`` is greater than 1, the HTMLs are generated by a pool
+    of worker processes.
+    """
+    process_xml = functools.partial(_process_xml, args=args)
+
+    jobs = args.jobs or multiprocessing.cpu_count()
+    if jobs == 1:
+        for xml in xmls:
+            yield process_xml(xml)
+        return
+
+    LOGGER.info('starting a pool of %s worker processes', jobs)
+    pool = multiprocessing.Pool(jobs, initializer=_init_worker,
+                                initargs=(args.nochecks,))
+    try:
+        for result in pool.imap(process_xml, xmls):
+            yield result
+
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def profile_xslt(xmls, args):
+    """Profiles the HTML XSLT while generating the HTML of each language of
+    each of `xmls`, without writing them.
+
+    Returns a `packtools.profiling.XSLTProfile` instance.
+    """
+    profile = profiling.XSLTProfile(
+            packtools.catalogs.XSLTS['root-html-1.2.xslt'])
+    for xml in xmls:
+        LOGGER.info('starting profiling of %s', xml)
+        try:
+            html_generator = get_htmlgenerator(xml, args.nonetwork,
+                                               args.nochecks, args.css,
+                                               profile=profile)
+            for lang in html_generator.languages:
+                html_generator.generate(lang)
+
+        except (XMLError, TypeError, exceptions.HTMLGenerationError) as e:
+            LOGGER.debug(e)
+            LOGGER.warning('Error profiling %s. Skipping. Run with DEBUG for more info.', xml)
+
+    return profile
+
+
 @packtools.utils.config_xml_catalog
 def main():
 
@@ -46,6 +218,12 @@ def main():
     parser.add_argument('--nochecks', action='store_true',
                         help='prevents the validation against SciELO PS spec')
     parser.add_argument('--css')
+    parser.add_argument('--rendercache', default=None,
+                        help='directory where the generated HTMLs are cached, to be reused while the XML file, the XSLT and the options are unchanged. The cache is checked before the XML is parsed and validated.')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of worker processes used to generate the HTMLs in parallel. 0 means the number of CPUs.')
+    parser.add_argument('--profile', action='store_true',
+                        help='instead of writing the HTMLs, measures the time spent on each template of the XSLT, and writes them ranked by time.')
     parser.add_argument('XML', nargs='+',
                         help='filesystem path or URL to the XML')
     parser.add_argument('--version', action='version', version=packtools_version)
@@ -56,34 +234,32 @@ def main():
 
     print('Please wait, this may take a while...', file=sys.stderr)
 
-    for xml in packtools.utils.flatten(args.XML):
-        LOGGER.info('starting generation of %s' % (xml,))
+    xmls = list(packtools.utils.flatten(args.XML))
 
-        try:
-            html_generator = get_htmlgenerator(xml, args.nonetwork, args.nochecks, args.css)
-            LOGGER.debug('HTMLGenerator repr: %s' % repr(html_generator))
-        except XMLError as e:
-            LOGGER.debug(e)
-            LOGGER.warning('Error generating %s. Skipping. Run with DEBUG for more info.', xml)
-            continue
-
-        try:
-            for lang, trans_result in html_generator:
-                fname, fext = xml.rsplit('.', 1)
-                out_fname = '.'.join([fname, lang, 'html'])
+    if args.profile:
+        print(profile_xslt(xmls, args).report())
+        return
 
-                with open(out_fname, 'wb') as fp:
-                    fp.write(etree.tostring(trans_result, pretty_print=True,
-                                            encoding='utf-8', method='html',
-                                            doctype=u"<!DOCTYPE html>"))
+    start = time.time()
+    generated = 0
+    for count, (xml, out_fnames, error, elapsed) in enumerate(
+            _process_xmls(xmls, args), 1):
+        for out_fname in out_fnames:
+            print('Generated HTML file:', out_fname)
 
-                print('Generated HTML file:', out_fname)
-        except TypeError as e:
-            LOGGER.debug(e)
+        if error is not None:
+            LOGGER.debug(error)
             LOGGER.warning('Error generating %s. Skipping. Run with DEBUG for more info.', xml)
-            continue
 
-        LOGGER.info('finished generating %s' % (xml,))
+        generated += len(out_fnames)
+        total_elapsed = time.time() - start
+        print('[%d/%d] %s: %d HTML files in %.3f s (%.2f XMLs/s)' % (
+            count, len(xmls), xml, len(out_fnames), elapsed,
+            count / (total_elapsed or 1e-9)), file=sys.stderr)
+
+    print('Generated %d HTML files from %d XMLs in %.2f s' % (
+        generated, len(xmls), time.time() - start),
+        file=sys.stderr)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,237 @@
+# coding: utf-8
+"""Profiling of the validation stages and of the HTML generation.
+
+The schematron schemas are compiled to XSLT, where each pattern is processed
+by its own template mode and each rule is a template of that mode. Therefore,
+the time spent on each pattern and rule is measured by running the validator
+XSLT with the libxslt profiler. The same profiler measures the time spent on
+each template of the XSLTs that generate the HTMLs.
+"""
+from __future__ import unicode_literals, division
+import collections
+
+from lxml import etree
+
+
+__all__ = ['SchematronProfile', 'XSLTProfile']
+
+
+XSL_NS = 'http://www.w3.org/1999/XSL/Transform'
+SVRL_NS = 'http://purl.oclc.org/dsdl/svrl'
+
+# libxslt reports the time spent on each template in units of 1/100 ms.
+XSLT_PROFILE_TIME_UNIT = 1e-5
+
+# Templates generated by the ISO skeleton to walk the document on each
+# pattern mode. They are not rules of the schema.
+TRAVERSAL_TEMPLATES = ('@*|node()', 'text()')
+
+# Label of the templates that do not belong to any pattern.
+OTHER_TEMPLATES = '(other)'
+
+
+def _get_pattern_modes(validator_xslt):
+    """Maps the template modes of `validator_xslt` to the ids of the
+    patterns of the schematron schema.
+    """
+    modes = {}
+    pattern_id = None
+    for elem in validator_xslt.iter('{%s}active-pattern' % SVRL_NS,
+                                    '{%s}apply-templates' % XSL_NS):
+        if elem.tag == '{%s}active-pattern' % SVRL_NS:
+            pattern_id = elem.findtext('{%s}attribute[@name="id"]' % XSL_NS)
+
+        elif elem.get('select') == '/' and elem.get('mode'):
+            mode = elem.get('mode')
+            modes[mode] = (pattern_id or mode).strip()
+            pattern_id = None
+
+    return modes
+
+
+def _get_template_label(template):
+    """Returns the match pattern, or the name, of a template reported by
+    the libxslt profiler, with normalized whitespace.
+    """
+    return ' '.join((template.get('match') or template.get('name')).split())
+
+
+class SchematronProfile(object):
+    """Time spent on each pattern and rule of a schematron schema,
+    accumulated over all documents passed to :meth:`run`.
+
+    The time of a rule comprises the evaluation of its assertions, and the
+    time of a pattern also comprises walking the document on its mode. The
+    time spent matching the nodes against the rule contexts is accounted
+    by libxslt to the callers, mostly to :data:`OTHER_TEMPLATES`.
+
+    :param schematron: `isoschematron.Schematron` instance created with
+                       ``store_xslt=True``, as the ones returned by
+                       :func:`packtools.domain.Schematron`.
+    """
+    def __init__(self, schematron):
+        validator_xslt = schematron.validator_xslt
+        if validator_xslt is None:
+            raise ValueError('The validator XSLT was not stored by the schematron')
+
+        self._validator_xslt = validator_xslt
+        self._modes = _get_pattern_modes(validator_xslt)
+
+        # maps (<pattern id>, <rule context>) to its time and calls
+        self.templates = collections.OrderedDict()
+        self.documents = 0
+
+    def run(self, xml_et):
+        """Validates `xml_et` with profiling enabled, and returns the
+        SVRL report.
+        """
+        # libxslt accumulates the profiling data on the compiled stylesheet
+        # across runs, so a new one is compiled for each document.
+        xslt = etree.XSLT(self._validator_xslt)
+        result = xslt(xml_et, profile_run=True)
+
+        for template in result.xslt_profile.getroot():
+            pattern_id = self._modes.get(template.get('mode'), OTHER_TEMPLATES)
+            context = _get_template_label(template)
+
+            stats = self.templates.setdefault((pattern_id, context),
+                                              {'time': 0.0, 'calls': 0})
+            stats['time'] += int(template.get('time')) * XSLT_PROFILE_TIME_UNIT
+            stats['calls'] += int(template.get('calls'))
+
+        self.documents += 1
+        return result
+
+    @property
+    def total_time(self):
+        return sum(stats['time'] for stats in self.templates.values())
+
+    def rules(self):
+        """Returns a list of 4-tuples in the form:
+        (<pattern id>, <rule context>, <time>, <calls>)
+        sorted by time, in descending order. The calls of a rule is the
+        number of nodes it has fired for.
+        """
+        rules = [(pattern_id, context, stats['time'], stats['calls'])
+                 for (pattern_id, context), stats in self.templates.items()
+                 if pattern_id != OTHER_TEMPLATES
+                 and context not in TRAVERSAL_TEMPLATES]
+
+        return sorted(rules, key=lambda rule: rule[2], reverse=True)
+
+    def patterns(self):
+        """Returns a list of 3-tuples in the form:
+        (<pattern id>, <time>, <fired rules>)
+        sorted by time, in descending order. The templates that do not
+        belong to any pattern are reported as :data:`OTHER_TEMPLATES`.
+        """
+        patterns = collections.OrderedDict()
+        for (pattern_id, context), stats in self.templates.items():
+            totals = patterns.setdefault(pattern_id, [0.0, 0])
+            totals[0] += stats['time']
+            if context not in TRAVERSAL_TEMPLATES:
+                totals[1] += stats['calls']
+
+        patterns = [(pattern_id, time, fired)
+                    for pattern_id, (time, fired) in patterns.items()]
+        return sorted(patterns, key=lambda pattern: pattern[1], reverse=True)
+
+    def report(self, limit=None):
+        """Formats the patterns and the rules ranked by time as text tables.
+
+        :param limit: (optional) maximum number of rows of each table.
+        """
+        total_time = self.total_time or 1.0
+        documents = self.documents or 1
+
+        lines = ['%d documents, %.3f s' % (self.documents, self.total_time),
+                 '',
+                 '%8s %6s %9s %8s  %s' % (
+                     'time (s)', '%', 'mean (ms)', 'fired', 'pattern')]
+        for pattern_id, time, fired in self.patterns()[:limit]:
+            lines.append('%8.3f %6.2f %9.2f %8d  %s' % (
+                time, time / total_time * 100, time / documents * 1000,
+                fired, pattern_id))
+
+        lines.extend(['', '%8s %6s %9s %8s  %s' % (
+            'time (s)', '%', 'mean (ms)', 'calls', 'pattern: rule context')])
+        for pattern_id, context, time, calls in self.rules()[:limit]:
+            lines.append('%8.3f %6.2f %9.2f %8d  %s: %s' % (
+                time, time / total_time * 100, time / documents * 1000,
+                calls, pattern_id, context))
+
+        return '\n'.join(lines)
+
+
+class XSLTProfile(object):
+    """Time spent on each template of an XSLT, accumulated over all
+    transformations run by :meth:`run`.
+
+    The time of a template comprises the instructions it runs, including
+    the evaluation of its XPath expressions, but not the time spent on the
+    templates it applies or calls.
+
+    :param xslt: path to the XSLT file, or its etree.
+    """
+    def __init__(self, xslt):
+        if not isinstance(xslt, etree._ElementTree):
+            xslt = etree.parse(xslt)
+
+        self._xslt_doc = xslt
+
+        # maps (<template match or name>, <mode>) to its time and calls
+        self.templates = collections.OrderedDict()
+        self.transformations = 0
+
+    def run(self, xml_et, **params):
+        """Transforms `xml_et` with profiling enabled, and returns the
+        result.
+
+        :param params: the XSLT parameters.
+        """
+        # libxslt accumulates the profiling data on the compiled stylesheet
+        # across runs, so a new one is compiled for each transformation.
+        xslt = etree.XSLT(self._xslt_doc)
+        result = xslt(xml_et, profile_run=True, **params)
+
+        for template in result.xslt_profile.getroot():
+            key = (_get_template_label(template), template.get('mode') or '')
+            stats = self.templates.setdefault(key, {'time': 0.0, 'calls': 0})
+            stats['time'] += int(template.get('time')) * XSLT_PROFILE_TIME_UNIT
+            stats['calls'] += int(template.get('calls'))
+
+        self.transformations += 1
+        return result
+
+    @property
+    def total_time(self):
+        return sum(stats['time'] for stats in self.templates.values())
+
+    def ranking(self):
+        """Returns a list of 4-tuples in the form:
+        (<template match or name>, <mode>, <time>, <calls>)
+        sorted by time, in descending order.
+        """
+        ranking = [(label, mode, stats['time'], stats['calls'])
+                   for (label, mode), stats in self.templates.items()]
+        return sorted(ranking, key=lambda template: template[2], reverse=True)
+
+    def report(self, limit=None):
+        """Formats the templates ranked by time as a text table.
+
+        :param limit: (optional) maximum number of rows.
+        """
+        total_time = self.total_time or 1.0
+        transformations = self.transformations or 1
+
+        lines = ['%d transformations, %.3f s' % (self.transformations,
+                                                 self.total_time),
+                 '',
+                 '%8s %6s %9s %8s  %s' % (
+                     'time (s)', '%', 'mean (ms)', 'calls', 'template [mode]')]
+        for label, mode, time, calls in self.ranking()[:limit]:
+            lines.append('%8.3f %6.2f %9.2f %8d  %s%s' % (
+                time, time / total_time * 100, time / transformations * 1000,
+                calls, label, ' [%s]' % mode if mode else ''))
+
+        return '\n'.join(lines)
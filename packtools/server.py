@@ -0,0 +1,293 @@
+# coding: utf-8
+"""Long-running HTTP server that validates XMLs and generates HTMLs.
+
+The work is done by a pool of worker processes that keep the DTDs, the
+schematron schemas and the HTML XSLT loaded, so the requests do not pay for
+the start-up of the interpreter and for loading the schemas.
+
+Endpoints:
+
+  - ``POST /validate``: the request body is the XML, and the response is the
+    same JSON produced by ``stylechecker`` for it.
+  - ``POST /html?lang=<lang>``: the request body is the XML, and the response
+    is its HTML in the language `lang`, or in the language of the main
+    document by default.
+  - ``GET /status``: reports the server is up.
+"""
+from __future__ import print_function, unicode_literals
+import argparse
+import io
+import json
+import logging
+import multiprocessing
+import sys
+import threading
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qs
+except ImportError:  # py2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qs
+
+from lxml import etree
+
+import packtools
+from packtools import exceptions, stylechecker
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+# Response sent to the requests that exceed the capacity of the server.
+BUSY_RESPONSE = (b'HTTP/1.0 503 Service Unavailable\r\n'
+                 b'Retry-After: 1\r\n'
+                 b'Content-Length: 0\r\n'
+                 b'Connection: close\r\n\r\n')
+
+# Maximum size, in bytes, of the request body.
+MAX_REQUEST_SIZE = 50 * 1024 * 1024
+
+
+#--------------------------------
+# tasks run by the worker processes
+#--------------------------------
+def _init_worker(options):
+    """Loads the DTDs, schematron schemas and the HTML XSLT once per worker
+    process.
+    """
+    packtools.domain.load_validators(options['extra_sch'], options['phases'])
+    packtools.domain.XSLT('root-html-1.2.xslt')
+
+
+def _error(status, exc):
+    body = json.dumps({'error': str(exc)}, sort_keys=True)
+    return status, 'application/json', body.encode('utf-8')
+
+
+def _parse(data, options):
+    return stylechecker.parse_xml(io.BytesIO(data), True,
+                                  cached_dtd=options['cached_dtd'])
+
+
+def _validate(data, options):
+    """Returns a 3-tuple in the form: (<status>, <content type>, <body>).
+    """
+    try:
+        validator = packtools.XMLValidator.parse(_parse(data, options),
+                extra_schematron=options['extra_sch'],
+                phases=options['phases'])
+        summary = stylechecker.summarize(validator)
+
+    except (etree.XMLSyntaxError, exceptions.XMLDoctypeError,
+            exceptions.XMLSPSVersionError) as exc:
+        return _error(400, exc)
+
+    except Exception as exc:
+        LOGGER.exception(exc)
+        return _error(500, exc)
+
+    body = json.dumps(summary, sort_keys=True)
+    return 200, 'application/json', body.encode('utf-8')
+
+
+def _generate_html(data, lang, options):
+    """Returns a 3-tuple in the form: (<status>, <content type>, <body>).
+    """
+    try:
+        generator = packtools.HTMLGenerator.parse(_parse(data, options),
+                valid_only=not options['no_checks'], css=options['css'])
+
+        lang = lang or generator.language
+        html = generator.generate(lang)
+
+    except (etree.XMLSyntaxError, exceptions.HTMLGenerationError,
+            ValueError) as exc:
+        return _error(400, exc)
+
+    except Exception as exc:
+        LOGGER.exception(exc)
+        return _error(500, exc)
+
+    body = etree.tostring(html, pretty_print=True, encoding='utf-8',
+                          method='html', doctype='<!DOCTYPE html>')
+    return 200, 'text/html; charset=utf-8', body
+
+
+#--------------------------------
+# http server
+#--------------------------------
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = 'packtools/' + packtools.__version__
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != '/status':
+            return self._send(*_error(404, 'Not found'))
+
+        body = json.dumps({'status': 'ok', 'version': packtools.__version__,
+                           'workers': self.server.workers}, sort_keys=True)
+        self._send(200, 'application/json', body.encode('utf-8'))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        if url.path == '/validate':
+            task, args = _validate, ()
+        elif url.path == '/html':
+            task, args = _generate_html, (params.get('lang', [None])[0],)
+        else:
+            return self._send(*_error(404, 'Not found'))
+
+        length = self.headers['Content-Length']
+        if length is None:
+            return self._send(*_error(411, 'Missing Content-Length'))
+
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+
+        if length < 0:
+            # reading a negative length would block until the client closes
+            # the connection.
+            return self._send(*_error(400, 'Invalid Content-Length'))
+
+        if length > self.server.max_request_size:
+            return self._send(*_error(413, 'The XML is too large'))
+
+        data = self.rfile.read(length)
+        self._send(*self.server.pool.apply(
+            task, (data,) + args + (self.server.options,)))
+
+    def log_message(self, format, *args):
+        LOGGER.info('%s - ' + format, self.address_string(), *args)
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    """HTTP server that validates XMLs and generates HTMLs on a pool of
+    `workers` processes.
+
+    At most `workers` + `backlog` requests are handled at the same time.
+    The ones in excess are answered with the status 503, so the clients can
+    back off and retry later.
+
+    :param address: 2-tuple in the form: (<host>, <port>).
+    :param workers: number of worker processes.
+    :param backlog: number of requests that may wait for a worker.
+    :param options: dict of the options of the validation and the HTML
+                    generation: `extra_sch`, `cached_dtd`, `phases`,
+                    `no_checks` and `css`.
+    :param max_request_size: (optional) maximum size, in bytes, of the XMLs.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, workers, backlog, options,
+                 max_request_size=MAX_REQUEST_SIZE):
+        HTTPServer.__init__(self, address, RequestHandler)
+
+        self.workers = workers
+        self.options = options
+        self.max_request_size = max_request_size
+        self._slots = threading.BoundedSemaphore(workers + backlog)
+        self.pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                         initargs=(options,))
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(False):
+            LOGGER.warning('rejecting request from %s: the server is busy',
+                           client_address[0])
+            try:
+                request.sendall(BUSY_RESPONSE)
+            finally:
+                self.shutdown_request(request)
+            return
+
+        try:
+            ThreadingMixIn.process_request(self, request, client_address)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            ThreadingMixIn.process_request_thread(self, request, client_address)
+        finally:
+            self._slots.release()
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self.pool.terminate()
+        self.pool.join()
+
+
+@packtools.utils.config_xml_catalog
+def main():
+    parser = argparse.ArgumentParser(
+            description='packtools validation and HTML generation server.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address the server listens on.')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=0,
+                        help='number of worker processes. 0 means the number of CPUs.')
+    parser.add_argument('--backlog', type=int, default=None,
+                        help='number of requests that may wait for a worker. the ones in excess are answered with the status 503. twice the number of workers by default.')
+    parser.add_argument('--max-size', type=int, default=MAX_REQUEST_SIZE,
+                        help='maximum size, in bytes, of the XMLs.')
+    parser.add_argument('--cacheddtd', action='store_true',
+                        help='skips loading the DTD while parsing the XML, and validates it against the DTD bundled with packtools.')
+    parser.add_argument('--extrasch', default=None,
+                        help='runs an extra validation using an external schematron schema.')
+    parser.add_argument('--phases', default=None,
+                        type=lambda value: value.split(','),
+                        help='comma-separated list of the schematron phases to be validated, or of the profiles: %s. all phases are validated by default.' % ', '.join(sorted(packtools.domain.SCHEMATRON_PROFILES)))
+    parser.add_argument('--nochecks', action='store_true',
+                        help='generates the HTML without validating the XML against SciELO PS spec.')
+    parser.add_argument('--css', default=None,
+                        help='URI of the CSS file referenced by the HTMLs.')
+    parser.add_argument('--version', action='version',
+                        version=packtools.__version__)
+    parser.add_argument('--loglevel', default='WARNING')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.loglevel.upper()))
+
+    workers = args.workers or multiprocessing.cpu_count()
+    backlog = 2 * workers if args.backlog is None else args.backlog
+    options = {
+        'extra_sch': args.extrasch,
+        'cached_dtd': args.cacheddtd,
+        'phases': args.phases,
+        'no_checks': args.nochecks,
+        'css': args.css,
+    }
+
+    if args.phases:
+        # unknown phases would make the workers fail on start-up.
+        try:
+            for version in packtools.domain.CURRENTLY_SUPPORTED_VERSIONS:
+                packtools.domain.StdSchematron(version, phases=args.phases)
+        except ValueError as exc:
+            sys.exit('Invalid phases: %s' % exc)
+
+    server = Server((args.host, args.port), workers, backlog, options,
+                    max_request_size=args.max_size)
+    print('Serving on http://%s:%s with %s workers' % (
+        args.host, server.server_address[1], workers), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
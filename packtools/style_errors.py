@@ -17,6 +17,11 @@ LOGGER = logging.getLogger(__name__)
 
 EXPOSE_ELEMENTNAME_PATTERN = re.compile(r"(?<=Element )'.*?'")
 
+SVRL_NS = 'http://purl.oclc.org/dsdl/svrl'
+SVRL_TEXT = '{%s}text' % SVRL_NS
+SVRL_ACTIVE_PATTERN = '{%s}active-pattern' % SVRL_NS
+SVRL_FAILED_ASSERT = '{%s}failed-assert' % SVRL_NS
+
 
 def search_element_name(message):
     """Try to locate in `message` the element name pointed as error.
@@ -53,6 +58,62 @@ def search_element(doc, xpath, line=None):
         raise ValueError("Could not find element '%s'." % xpath)
 
 
+class ElementIndex(object):
+    """Index of the nodes of `doc` by their source line and tag name.
+
+    The index is built in a single traversal of the tree, and is meant to
+    be shared by all lookups of errors of the same document.
+
+    :param doc: etree._ElementTree instance.
+    """
+    def __init__(self, doc):
+        self.doc = doc
+
+        self._by_line = {}
+        self._by_tag = {}
+        self._by_tag_and_line = {}
+        for elem in doc.iter():
+            self._by_line.setdefault(elem.sourceline, elem)
+
+            # comments, processing instructions and entities have
+            # factory functions as tags.
+            if callable(elem.tag):
+                continue
+
+            self._by_tag.setdefault(elem.tag, []).append(elem)
+            self._by_tag_and_line.setdefault((elem.tag, elem.sourceline), elem)
+
+    def element_at_line(self, line):
+        """The first node at the source line `line`.
+        """
+        try:
+            return self._by_line[line]
+        except KeyError:
+            LOGGER.info("Could not find element at the line %s", line)
+            raise ValueError("Could not find element at the line %s" % line)
+
+    def elements_by_tag(self, tagname):
+        """All elements named `tagname`, in document order.
+        """
+        return self._by_tag.get(tagname, [])
+
+    def find_element(self, tagname, line=None):
+        """The first element named `tagname`, optionally at the source
+        line `line`.
+
+        It is equivalent to ``search_element(doc, '//' + tagname, line)``.
+        """
+        try:
+            if line is None:
+                return self._by_tag[tagname][0]
+            else:
+                return self._by_tag_and_line[(tagname, line)]
+
+        except KeyError:
+            LOGGER.info("Could not find element '//%s'.", tagname)
+            raise ValueError("Could not find element '//%s'." % tagname)
+
+
 #--------------------------------
 # adapters for XML style errors
 #--------------------------------
@@ -61,6 +122,8 @@ class StyleErrorBase(object):
 
     A basic implementation of `get_apparent_element` is provided.
     """
+    __slots__ = ()
+
     # to keep compatibility with lxml api
     line = None
     column = None
@@ -71,14 +134,20 @@ class StyleErrorBase(object):
     level = None
     level_name = level
 
-    def get_apparent_element(self, doc):
+    def get_apparent_element(self, doc, index=None):
         """The apparent element presenting the error at doc.
 
         This base implementation tries to discover the element name by
         searching the string pattern `Element 'element name'` on message.
+
+        :param doc: etree._ElementTree instance.
+        :param index: (optional) :class:`ElementIndex` instance of `doc`.
         """
         tagname = search_element_name(self.message)
-        return search_element(doc, '//' + tagname, line=self.line)
+        if index is None:
+            return search_element(doc, '//' + tagname, line=self.line)
+        else:
+            return index.find_element(tagname, line=self.line)
 
 
 class StyleError(StyleErrorBase):
@@ -99,41 +168,135 @@ class SchemaStyleError(StyleErrorBase):
         self.message = self._err.message
         self.line = self._err.line
 
-    def get_apparent_element(self, doc):
-        for elem in doc.iter():
-            if elem.sourceline == self.line:
-                return elem
-        else:
-            LOGGER.info("Could not find element at the line %s", self.line)
-            raise ValueError("Could not find element at the line %s" % self.line)
+    def get_apparent_element(self, doc, index=None):
+        if index is None:
+            index = ElementIndex(doc)
+
+        return index.element_at_line(self.line)
 
 
 class SchematronStyleError(StyleErrorBase):
     """ SciELO-style errors raised by schematron validation.
+
+    An instance can be created from an entry of the schematron error log, or
+    directly from the ``svrl:failed-assert`` element of the validation report.
+    All the fields are read from the SVRL element on demand.
+
+    :param err_object: (optional) entry of the schematron error log.
+    :param element: (optional) the ``svrl:failed-assert`` element.
+    :param pattern_id: (optional) the id of the pattern that failed.
+    :param schema: (optional) the path of the schema the pattern came from,
+                   for schemas composed by :func:`packtools.domain.CompositeSchematron`.
     """
+    __slots__ = ('_err', '_element', '_message', 'pattern_id', 'schema')
+
     level = u'Style Error'
     level_name = level
 
-    def __init__(self, err_object):
+    def __init__(self, err_object=None, element=None, pattern_id=None,
+                 schema=None):
+        if err_object is None and element is None:
+            raise TypeError('err_object or element must be provided')
+
         self._err = err_object
+        self._element = element
+        self._message = None
+        self.pattern_id = pattern_id
+        self.schema = schema
+
+    @property
+    def svrl(self):
+        """The ``svrl:failed-assert`` element.
+        """
+        if self._element is None:
+            byte_string = io.BytesIO(self._err.message.encode('utf-8'))
+            self._element = etree.parse(byte_string).getroot()
 
-        byte_string = io.BytesIO(self._err.message.encode('utf-8'))
-        self._parsed_message = etree.parse(byte_string)
+        return self._element
 
     @property
     def message(self):
-        try:
-            text = re.search(r"<svrl:text>(.*)</svrl:text>", self._err.message, re.DOTALL).group(1)
-        except AttributeError:
-            raise ValueError('Cannot get the message from %s.' % self._err)
+        if self._message is None:
+            text = self.svrl.find(SVRL_TEXT)
+            if text is None:
+                raise ValueError('Cannot get the message from %s.' % self._err)
 
-        return text.strip()
+            self._message = u''.join(text.itertext()).strip()
 
-    def get_apparent_element(self, doc):
-        try:
-            tagname = self._parsed_message.xpath('@location')[0]
-        except IndexError:
-            raise ValueError('Cannot get the context info from %s.' % self._err.message)
+        return self._message
+
+    @property
+    def location(self):
+        return self.svrl.get('location')
+
+    @property
+    def test(self):
+        return self.svrl.get('test')
+
+    @property
+    def role(self):
+        return self.svrl.get('role')
+
+    def get_apparent_element(self, doc, index=None):
+        location = self.location
+        if location is None:
+            raise ValueError('Cannot get the context info from %s.' % self.message)
+
+        return search_element(doc, location)
+
+
+def _parse_error_log(error_log):
+    """Parses all the entries of a schematron error log at once.
+    """
+    if not error_log:
+        return []
+
+    messages = u''.join(err.message for err in error_log)
+    wrapper = etree.fromstring(u'<errors>%s</errors>' % messages)
+
+    return [SchematronStyleError(err, element=element)
+            for err, element in zip(error_log, wrapper)]
+
+
+def _parse_validation_report(report, pattern_sources=None):
+    """Walks the SVRL report once, producing the failed assertions
+    annotated with the id of their patterns and, if `pattern_sources` is
+    given, with the schemas the patterns came from.
+    """
+    if pattern_sources is None:
+        pattern_sources = {}
+
+    errors = []
+    pattern_id = None
+    for element in report.getroot().iterchildren():
+        if element.tag == SVRL_ACTIVE_PATTERN:
+            pattern_id = element.get('id')
+
+        elif element.tag == SVRL_FAILED_ASSERT:
+            errors.append(SchematronStyleError(element=element,
+                    pattern_id=pattern_id,
+                    schema=pattern_sources.get(pattern_id)))
+    return errors
+
+
+def make_schematron_errors(schematron):
+    """Returns a list of :class:`SchematronStyleError` for the last
+    validation performed by `schematron`.
+
+    The SVRL validation report is used when it is stored by `schematron`,
+    otherwise the error log is used and the pattern ids are not available.
+    The errors of composed schemas are attributed to the schemas they came
+    from.
+
+    :param schematron: `isoschematron.Schematron` instance.
+    """
+    error_log = schematron.error_log
+    report = schematron.validation_report
 
-        return search_element(doc, tagname)
+    if report is not None:
+        errors = _parse_validation_report(report,
+                getattr(schematron, 'pattern_sources', None))
+        if len(errors) == len(error_log):
+            return errors
 
+    return _parse_error_log(error_log)
@@ -7,11 +7,18 @@ import pkg_resources
 import json
 import logging
 import pathlib
+import functools
+import multiprocessing
+import collections
+import threading
+import io
+import gzip
+import hashlib
 
 from lxml import etree
 
 import packtools
-from packtools import exceptions
+from packtools import exceptions, profiling
 
 
 __all__ = ['summarize', 'annotate']
@@ -30,9 +37,45 @@ code for more information.
 ERR_MESSAGE = "Something went wrong while working on {filename}: {details}."
 
 
-def get_xmlvalidator(xmlpath, no_network, extra_sch):
-    parsed_xml = packtools.XML(xmlpath, no_network=no_network)
-    return packtools.XMLValidator.parse(parsed_xml, extra_schematron=extra_sch)
+def parse_xml(xml, no_network, cached_dtd=False):
+    """Parses `xml`, a filesystem path, URL or file-object.
+
+    If `cached_dtd` is True, the external DTD is not loaded during the parse,
+    and the blank text is removed according to the DTD bundled with
+    packtools. Documents that depend on the DTD to be parsed, e.g. due to
+    named entities, are parsed again with the DTD.
+    """
+    if cached_dtd:
+        try:
+            parsed_xml = packtools.XML(xml, no_network=no_network,
+                                       load_dtd=False, remove_blank_text=False)
+        except etree.XMLSyntaxError as exc:
+            LOGGER.info('could not parse %s without the DTD: %s', xml, exc)
+            if hasattr(xml, 'seek'):
+                xml.seek(0)
+            parsed_xml = packtools.XML(xml, no_network=no_network)
+        else:
+            public_id = parsed_xml.docinfo.public_id
+            if public_id in packtools.catalogs.DTD_PUBLIC_IDS:
+                packtools.utils.remove_blank_text(
+                        parsed_xml, packtools.domain.StdDTD(public_id))
+    else:
+        parsed_xml = packtools.XML(xml, no_network=no_network)
+
+    return parsed_xml
+
+
+def get_xmlvalidator(xmlpath, no_network, extra_sch, cached_dtd=False,
+                     timing=False, phases=None):
+    """Returns an instance of XMLValidator for `xmlpath`.
+
+    If `cached_dtd` is True, the document is validated against the DTD
+    bundled with packtools. See :func:`parse_xml`.
+    """
+    parsed_xml = parse_xml(xmlpath, no_network, cached_dtd=cached_dtd)
+
+    return packtools.XMLValidator.parse(parsed_xml, extra_schematron=extra_sch,
+                                        timing=timing, phases=phases)
 
 
 def annotate(validator, buff, encoding=None):
@@ -53,7 +96,8 @@ def summarize(validator, assets_basedir=None):
         err_msg = {'message': err.message}
 
         try:
-            err_element = err.get_apparent_element(validator.lxml)
+            err_element = err.get_apparent_element(validator.lxml,
+                    index=validator.element_index)
         except ValueError:
             LOGGER.info('Could not locate the element name in: %s', err.message)
             err_element = None
@@ -79,9 +123,104 @@ def summarize(validator, assets_basedir=None):
         summary['assets'] = validator.lookup_assets(assets_basedir)
         LOGGER.info('total assets referenced: %s', len(summary['assets']))
 
+    if validator.timings is not None:
+        summary['timings'] = validator.timings.as_dict()
+
     return summary
 
 
+class PrettyJSONWriter(object):
+    """Writes summaries to `stream` as the items of a prettified JSON array.
+
+    Each summary is written as soon as it is received, but for its closing
+    brace, that is written along with the separator of the next item. The
+    memory usage does not depend on the number of summaries, and the output
+    is the same of :func:`packtools.utils.prettify` for the list of all
+    summaries.
+
+    :param stream: text-mode file-object.
+    :param colorize: (optional) highlight the output with ANSI escape sequences.
+    """
+    def __init__(self, stream, colorize=False):
+        self.stream = stream
+        self.colorize = colorize
+        self._count = 0
+        # the last line of the previous item, that is followed by a comma
+        # only if another item is written.
+        self._pending_line = None
+
+    def _write(self, text):
+        if self.colorize:
+            # the text is split at the ends of lines, that are the units of
+            # the highlighting, so the output is the same as if the whole
+            # document were highlighted at once.
+            text = packtools.utils.colorize_json(text)
+
+        self.stream.write(text)
+        self.stream.flush()
+
+    def write(self, summary):
+        json_str = json.dumps(summary, indent=2, sort_keys=True)
+        lines = ['  ' + line for line in json_str.splitlines()]
+
+        if self._count == 0:
+            head = '[\n'
+        else:
+            head = self._pending_line + ',\n'
+
+        self._write(head + ''.join(line + '\n' for line in lines[:-1]))
+        self._pending_line = lines[-1]
+        self._count += 1
+
+    def close(self):
+        if self._count:
+            # the output ends as `print(prettify(summaries))` does.
+            self._write(self._pending_line + '\n]')
+            self.stream.write('\n')
+            self.stream.flush()
+
+
+class NDJSONWriter(object):
+    """Writes summaries to `stream` as newline delimited JSON.
+
+    :param stream: text-mode file-object.
+    """
+    def __init__(self, stream, colorize=False):
+        self.stream = stream
+
+    def write(self, summary):
+        self.stream.write(json.dumps(summary, sort_keys=True) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+def _open_output(path):
+    """Opens `path` for writing text. The content is gzip-compressed if the
+    file name ends with `.gz`.
+    """
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'wb'), encoding='utf-8')
+    else:
+        return io.open(path, 'w', encoding='utf-8')
+
+
+def format_timings(timings):
+    """Formats the aggregated `timings` of a batch as a text table.
+
+    :param timings: packtools.utils.Timings instance.
+    """
+    lines = ['%-18s %7s %10s %10s %10s' % (
+        'stage', 'count', 'wall (s)', 'cpu (s)', 'mean (ms)')]
+    for stage, totals in timings.stages.items():
+        mean = totals['wall'] / totals['count'] * 1000 if totals['count'] else 0
+        lines.append('%-18s %7d %10.3f %10.3f %10.1f' % (
+            stage, totals['count'], totals['wall'], totals['cpu'], mean))
+
+    return '\n'.join(lines)
+
+
 def _make_relative_to_base(base, paths):
     for path in paths:
         # pure paths don't access the filesystem
@@ -94,38 +233,312 @@ def _make_relative_to_base(base, paths):
         yield str(relative_path)
 
 
-def validate_zip_package(filepath):
+def _validate_zip_member(member):
+    """Validates the XML document `member` of a zip package.
+
+    :param member: 3-tuple in the form (<filename>, <bytes>, <package_members>).
+    """
+    xml, data, package_members = member
+
+    # useful for looking-up files relative to the xml file
+    xml_dirname = os.path.dirname(xml)
+
+    try:
+        validator = packtools.XMLValidator.parse(io.BytesIO(data))
+
+    except (exceptions.PacktoolsError, etree.XMLSyntaxError) as exc:
+        exc_type = type(exc).__name__
+        exc_value = str(exc)
+        summary = None
+
+    else:
+        exc_type = None
+        exc_value = None
+
+        paths = _make_relative_to_base(xml_dirname, package_members)
+        summary = summarize(validator, paths)
+
+    return (xml, summary, exc_type, exc_value)
+
+
+def validate_zip_package(filepath, jobs=1, max_pending=None):
     """Validates all documents in a zip package.
 
     Returns a generator object that produces validation reports for each
-    XML document. Validation reports are represented as 5-tuples in the form:
-    (<filename>, <is_valid>, <validation_errors>, <exc_type>, <exc_value>)
+    XML document. Validation reports are represented as 4-tuples in the form:
+    (<filename>, <summary>, <exc_type>, <exc_value>)
+
+    When `jobs` is greater than 1, the documents are validated concurrently
+    by a pool of worker processes, and the reports are produced in the same
+    order of the sequential validation. At most `max_pending` documents are
+    read from the package and waiting to be validated at any given time.
+
+    :param filepath: Path to the zip file.
+    :param jobs: (optional) number of worker processes. 0 means the number of CPUs.
+    :param max_pending: (optional) the default value is twice the number of jobs.
     """
+    jobs = jobs or multiprocessing.cpu_count()
+    max_pending = max_pending or jobs * 2
+
     with packtools.utils.Xray.fromfile(filepath) as xpack:
         xmls = xpack.show_sorted_members().get('xml', [])
+        package_members = xpack.show_members()
+
+        def read_members():
+            for xml in xmls:
+                with xpack.get_file(xml) as file:
+                    yield xml, file.read(), package_members
+
+        if jobs == 1:
+            for member in read_members():
+                yield _validate_zip_member(member)
+            return
+
+        pool = multiprocessing.Pool(
+                jobs, initializer=packtools.domain.load_validators)
+        try:
+            for report in _imap_bounded(pool, _validate_zip_member,
+                                        read_members(), max_pending):
+                yield report
+
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+
+def _imap_bounded(pool, func, iterable, max_pending, ordered=True):
+    """Produces the results of `func` for each item of `iterable`, computed
+    by `pool`, as ``pool.imap`` does, or ``pool.imap_unordered`` if not
+    `ordered`.
+
+    Unlike them, an item is read from `iterable` only while less than
+    `max_pending` results are waiting to be produced, so the memory used
+    does not grow with the number of items, even behind a slow one.
+    """
+    pending = collections.deque()
+    finished = threading.Event()
+
+    def pop_result():
+        if ordered:
+            return pending.popleft()
+
+        while True:
+            finished.clear()
+            for result in pending:
+                if result.ready():
+                    pending.remove(result)
+                    return result
+            # the callback is not called for the tasks that raise.
+            finished.wait(0.1)
+
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,),
+                                        callback=lambda _: finished.set()))
+        if len(pending) >= max_pending:
+            yield pop_result().get()
+
+    while pending:
+        yield pop_result().get()
+
+
+def _process_xml(xml, args):
+    """Validates `xml` according to the command line `args`.
+
+    Returns a 5-tuple in the form:
+    (<xml>, <summary>, <annotated_file>, <error>, <timings>)
+    where only one of <summary>, <annotated_file> or <error> is set. All of
+    them are None if the validation was skipped. <timings> is the dict of
+    the times spent on each validation stage, if ``args.timings`` is set.
+    """
+    LOGGER.info('starting validation of %s', xml)
+
+    result_cache = _get_result_cache(args)
+    cache_key = None
+    if (result_cache is not None and not args.annotated
+            and not xml.startswith(('http:', 'https:'))):
+        cache_key = _result_cache_key(
+                xml, os.listdir(args.assetsdir or os.path.dirname(xml)))
+        if not args.resultcache_bypass:
+            summary = result_cache.get(cache_key)
+            if summary is not None:
+                LOGGER.info('using the cached result of %s', xml)
+                summary['_xml'] = xml
+                return xml, summary, None, None, None
+
+    try:
+        validator = get_xmlvalidator(xml, args.nonetwork, args.extrasch,
+                                     cached_dtd=args.cacheddtd,
+                                     timing=args.timings,
+                                     phases=args.phases)
+
+    except (etree.XMLSyntaxError, exceptions.XMLDoctypeError,
+            exceptions.XMLSPSVersionError) as exc:
+        LOGGER.exception(exc)
+        return xml, None, None, str(exc), None
+
+    summary = annotated_file = None
+    if args.annotated:
+
+        fname, fext = xml.rsplit('.', 1)
+        annotated_file = '.'.join([fname, 'annotated', fext])
 
+        with open(annotated_file, 'wb') as fp:
+            annotate(validator, fp)
+
+    else:
+        # remote XML will not lookup for assets
+        if xml.startswith(('http:', 'https:')):
+            assetsdir = None
+        else:
+            assetsdir = args.assetsdir or os.path.dirname(xml)
+
+        assetsdir_files = os.listdir(assetsdir)  # list of files in dir
+        try:
+            summary = summarize(validator, assets_basedir=assetsdir_files)
+        except TypeError as exc:
+            LOGGER.exception(exc)
+            LOGGER.warning(
+                    'Error validating %s. Skipping. Run with DEBUG for more info.',
+                    xml)
+            return xml, None, None, None, None
+
+        if cache_key is not None:
+            result_cache.set(cache_key, dict((name, value)
+                for name, value in summary.items() if name != 'timings'))
+
+        summary['_xml'] = xml
+
+    timings = validator.timings.as_dict() if args.timings else None
+
+    LOGGER.info('finished validating %s', xml)
+    return xml, summary, annotated_file, None, timings
+
+
+def _get_result_cache(args):
+    """Returns the `packtools.utils.ResultCache` of the process, or None if
+    it is not enabled by ``args.resultcache``.
+    """
+    if not args.resultcache:
+        return None
+
+    caches = packtools.utils.setdefault(_get_result_cache, 'cache', lambda: {})
+    options = (args.resultcache, args.nonetwork, args.cacheddtd,
+               tuple(args.phases or ()), args.extrasch)
+    if options not in caches:
+        caches[options] = packtools.utils.ResultCache(
+                args.resultcache, _result_cache_fingerprint(args))
+
+    return caches[options]
+
+
+def _result_cache_fingerprint(args):
+    """Identifies everything, besides the XML and its assets, that the
+    summary of a validation depends on: the versions of packtools and lxml,
+    the schemas and the command line options.
+    """
+    fingerprint = hashlib.sha1()
+    for value in (packtools.__version__, etree.LXML_VERSION,
+                  etree.LIBXML_VERSION, etree.LIBXSLT_VERSION,
+                  packtools.domain.CURRENTLY_SUPPORTED_VERSIONS,
+                  args.nonetwork, args.cacheddtd, args.phases):
+        fingerprint.update(repr(value).encode('utf-8'))
+
+    catalogs_dir = os.path.dirname(packtools.catalogs.__file__)
+    files = sorted(os.path.join(root, name)
+                   for root, _, names in os.walk(catalogs_dir)
+                   for name in names if not name.endswith('.pyc'))
+    if args.extrasch:
+        files.append(args.extrasch)
+
+    for path in files:
+        with open(path, 'rb') as fp:
+            fingerprint.update(fp.read())
+
+    return fingerprint.hexdigest()
+
+
+def _result_cache_key(xml, assetsdir_files):
+    """The summary of `xml` depends on its content and on the files of the
+    directory where its assets are looked up.
+    """
+    key = hashlib.sha1()
+    with open(xml, 'rb') as fp:
+        key.update(fp.read())
+
+    key.update(repr(sorted(assetsdir_files)).encode('utf-8'))
+    return key.hexdigest()
+
+
+def _process_xmls(xmls, args):
+    """Produces the results of :func:`_process_xml` for each of `xmls`.
+
+    When ``args.jobs`` is greater than 1, the XMLs are validated by a pool
+    of worker processes. The results are produced in the same order of
+    `xmls`, unless ``args.unordered`` is set. At most twice the number of
+    jobs XMLs are read from `xmls` and waiting for their results at any
+    given time.
+    """
+    process_xml = functools.partial(_process_xml, args=args)
+
+    jobs = args.jobs or multiprocessing.cpu_count()
+    if jobs == 1:
         for xml in xmls:
-            # useful for looking-up files relative to the xml file
-            xml_dirname = os.path.dirname(xml)
+            yield process_xml(xml)
+        return
+
+    LOGGER.info('starting a pool of %s worker processes', jobs)
+    pool = multiprocessing.Pool(jobs,
+                                initializer=packtools.domain.load_validators,
+                                initargs=(args.extrasch, args.phases))
+    try:
+        for result in _imap_bounded(pool, process_xml, xmls, jobs * 2,
+                                    ordered=not args.unordered):
+            yield result
+
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def profile_schematron(xmls, args):
+    """Profiles the schematron schemas used to validate each of `xmls`.
 
-            with xpack.get_file(xml) as file:
-                try:
-                    validator = packtools.XMLValidator.parse(file)
+    Returns a dict of `packtools.profiling.SchematronProfile` instances,
+    keyed by the SPS version or the path of the extra schematron.
+    """
+    profiles = collections.OrderedDict()
+    for xml in xmls:
+        LOGGER.info('starting profiling of %s', xml)
+        try:
+            validator = get_xmlvalidator(xml, args.nonetwork, args.extrasch,
+                                         cached_dtd=args.cacheddtd,
+                                         phases=args.phases)
+
+        except (etree.XMLSyntaxError, exceptions.XMLDoctypeError,
+                exceptions.XMLSPSVersionError) as exc:
+            LOGGER.exception(exc)
+            print(ERR_MESSAGE.format(filename=xml, details=str(exc)),
+                    file=sys.stderr)
+            continue
 
-                except exceptions.PacktoolsError as exc:
-                    exc_type = type(exc).__name__
-                    exc_value = str(exc)
-                    summary = None
+        schemas = [(validator.sps_version, validator.schematron)]
+        if validator.extra_schematron:
+            schemas.append((args.extrasch, validator.extra_schematron))
 
-                else:
-                    exc_type = None
-                    exc_value = None
+        for name, schematron in schemas:
+            if name not in profiles:
+                profiles[name] = profiling.SchematronProfile(
+                        schematron)
 
-                    paths = _make_relative_to_base(xml_dirname,
-                            xpack.show_members())
-                    summary = summarize(validator, paths)
+            profiles[name].run(validator.lxml)
 
-            yield (xml, summary, exc_type, exc_value)
+    return profiles
 
 
 @packtools.utils.config_xml_catalog
@@ -145,6 +558,8 @@ def _main():
 
     parser.add_argument('--nonetwork', action='store_true',
                         help='prevents the retrieval of the DTD through the network')
+    parser.add_argument('--cacheddtd', action='store_true',
+                        help='skips loading the DTD while parsing the XML, and validates it against the DTD bundled with packtools.')
     parser.add_argument('--assetsdir', default=None,
                         help='lookup, at the given directory, for each asset referenced by the XML. current working directory will be used by default.')
     parser.add_argument('--version', action='version', version=packtools_version)
@@ -155,6 +570,29 @@ def _main():
                         help='runs an extra validation using an external schematron schema.')
     parser.add_argument('--sysinfo', action='store_true',
                         help='show program\'s installation info and exit.')
+    parser.add_argument('--warm-cache', action='store_true',
+                        help='compiles the schematron schemas, including the one passed to --extrasch, storing them at the on-disk cache, removes the other compiled schemas from the cache, and exit.')
+    parser.add_argument('--output', default=None,
+                        help='writes the results to the given file instead of stdout. the file is gzip-compressed if its name ends with .gz.')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of worker processes used to validate the XMLs in parallel. 0 means the number of CPUs.')
+    parser.add_argument('--unordered', action='store_true',
+                        help='when running in parallel, report the results as soon as they are ready, regardless of the order of the arguments.')
+    parser.add_argument('--profile', action='store_true',
+                        help='instead of validating the XMLs, measures the time spent on each schematron pattern and rule, and writes them ranked by time.')
+    parser.add_argument('--timings', action='store_true',
+                        help='records the time spent on each validation stage, adding it to the results, and writes the totals to stderr at the end.')
+    parser.add_argument('--phases', default=None,
+                        type=lambda value: value.split(','),
+                        help='comma-separated list of the schematron phases to be validated, or of the profiles: %s. all phases are validated by default.' % ', '.join(sorted(packtools.domain.SCHEMATRON_PROFILES)))
+    parser.add_argument('--resultcache', default=None, metavar='PATH',
+                        help='reuses the results of the XMLs validated before, that are stored at the given SQLite database. a result is reused while the XML, the files of its assets dir, the schemas, the options and the version of packtools are unchanged.')
+    parser.add_argument('--resultcache-bypass', action='store_true',
+                        help='validates the XMLs again, replacing their results at the --resultcache.')
+    parser.add_argument('--resultcache-prune', type=float, default=None, metavar='DAYS',
+                        help='removes from the --resultcache the results not used in the given number of days, whatever options they were validated with, and exit.')
+    parser.add_argument('--resultcache-prune-others', action='store_true',
+                        help='with --resultcache-prune, also removes the results that cannot be reused by the given options, i.e. the ones validated with other options or versions of the schemas.')
     parser.add_argument('XML', nargs='*',
                         help='filesystem path or URL to the XML')
     args = parser.parse_args()
@@ -165,63 +603,89 @@ def _main():
         print(packtools.utils.prettify(packtools.get_debug_info(), colorize=args.nocolors))
         sys.exit(0)
 
+    if args.warm_cache:
+        if not packtools.domain.CACHE_DIR:
+            sys.exit('The on-disk cache is disabled. Check the env var PACKTOOLS_CACHE_DIR.')
+
+        schemas = sorted(path for path in packtools.catalogs.SCHEMAS.values()
+                         if path.endswith('.sch'))
+        if args.extrasch:
+            schemas.append(args.extrasch)
+
+        packtools.domain.warm_schematron_cache(schemas, prune=True)
+
+        for schema in schemas:
+            print('Cached schematron:', schema)
+
+        sys.exit(0)
+
+    if args.resultcache_prune is not None:
+        if not args.resultcache:
+            sys.exit('The option --resultcache is required.')
+
+        removed = _get_result_cache(args).prune(
+                args.resultcache_prune * 24 * 60 * 60,
+                other_fingerprints=args.resultcache_prune_others)
+        print('Removed results:', removed)
+        sys.exit(0)
+
+    if args.phases:
+        # the schemas restricted to the phases are compiled beforehand, so
+        # unknown phases are reported only once.
+        try:
+            for version in packtools.domain.CURRENTLY_SUPPORTED_VERSIONS:
+                packtools.domain.StdSchematron(version, phases=args.phases)
+        except ValueError as exc:
+            sys.exit('Invalid phases: %s' % exc)
+
     print('Please wait, this may take a while...', file=sys.stderr)
 
     input_args = args.XML or sys.stdin
-    summary_list = []
 
+    if args.profile:
+        xmls = packtools.utils.flatten(input_args)
+        for name, profile in profile_schematron(xmls, args).items():
+            print('Schematron:', name)
+            print(profile.report())
+            print()
 
-    for xml in packtools.utils.flatten(input_args):
-        LOGGER.info('starting validation of %s', xml)
+        sys.exit(0)
 
-        try:
-            validator = get_xmlvalidator(xml, args.nonetwork, args.extrasch)
+    if args.output:
+        output = _open_output(args.output)
+        colorize = False
+    else:
+        output = sys.stdout
+        colorize = args.nocolors
 
-        except (etree.XMLSyntaxError, exceptions.XMLDoctypeError,
-                exceptions.XMLSPSVersionError) as exc:
-            LOGGER.exception(exc)
-            print(ERR_MESSAGE.format(filename=xml, details=exc),
-                    file=sys.stderr)
-            continue
+    writer_class = NDJSONWriter if args.raw else PrettyJSONWriter
+    writer = writer_class(output, colorize=colorize)
+    total_timings = packtools.utils.Timings()
 
-        if args.annotated:
+    try:
+        xmls = packtools.utils.flatten(input_args)
+        for xml, summary, annotated_file, error, timings in _process_xmls(
+                xmls, args):
+            if timings is not None:
+                total_timings.update(timings)
 
-            fname, fext = xml.rsplit('.', 1)
-            out_fname = '.'.join([fname, 'annotated', fext])
+            if error is not None:
+                print(ERR_MESSAGE.format(filename=xml, details=error),
+                        file=sys.stderr)
 
-            with open(out_fname, 'wb') as fp:
-                annotate(validator, fp)
+            elif annotated_file is not None:
+                print('Annotated XML file:', annotated_file)
 
-            print('Annotated XML file:', out_fname)
+            elif summary is not None:
+                writer.write(summary)
 
-        else:
-            # remote XML will not lookup for assets
-            if xml.startswith(('http:', 'https:')):
-                assetsdir = None
-            else:
-                assetsdir = args.assetsdir or os.path.dirname(xml)
-
-            assetsdir_files = os.listdir(assetsdir)  # list of files in dir
-            try:
-                summary = summarize(validator, assets_basedir=assetsdir_files)
-            except TypeError as exc:
-                LOGGER.exception(exc)
-                LOGGER.warning(
-                        'Error validating %s. Skipping. Run with DEBUG for more info.',
-                        xml)
-                continue
-
-            summary['_xml'] = xml
-
-            if args.raw:
-                print(json.dumps(summary, sort_keys=True))
-            else:
-                summary_list.append(summary)
-
-        LOGGER.info('finished validating %s', xml)
-
-    if summary_list:
-        print(packtools.utils.prettify(summary_list, colorize=args.nocolors))
+    finally:
+        writer.close()
+        if args.output:
+            output.close()
+
+    if args.timings:
+        print(format_timings(total_timings), file=sys.stderr)
 
 
 def main():
@@ -7,6 +7,13 @@ import os
 import glob
 import sys
 import json
+import errno
+import tempfile
+import threading
+import time
+import contextlib
+import sqlite3
+from collections import OrderedDict, deque
 import unicodedata
 import zipfile
 
@@ -37,6 +44,196 @@ def setdefault(object, attribute, producer):
     return getattr(object, attribute)
 
 
+class LRUCache(object):
+    """Mapping of bounded size that discards the least recently used items.
+
+    :param maxsize: the maximum number of items.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            value = self._data.pop(key)
+            self._data[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DirectoryCache(object):
+    """Mapping of string keys to bytes persisted as files at the directory
+    `path`, which may be shared by many processes.
+
+    It has the same interface of :class:`LRUCache`, but it is not bounded.
+
+    :param path: path to the directory.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _get_path(self, key):
+        # the files are spread over subdirectories to keep them small.
+        return os.path.join(self.path, key[:2], key)
+
+    def __getitem__(self, key):
+        try:
+            with open(self._get_path(key), mode='rb') as fp:
+                return fp.read()
+        except (IOError, OSError):
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        write_file_atomically(self._get_path(key), value)
+
+    def __contains__(self, key):
+        return os.path.exists(self._get_path(key))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+try:
+    _wall_clock = time.perf_counter
+    _cpu_clock = time.process_time
+except AttributeError:  # py2
+    _wall_clock = time.time
+    _cpu_clock = time.clock
+
+
+class Timings(object):
+    """Accumulates the wall-clock and CPU time, in seconds, spent on named
+    stages.
+
+    The CPU time is measured for the whole process, so it includes the time
+    spent by other threads running concurrently.
+    """
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        """Context manager that measures the time spent on its block.
+        """
+        wall, cpu = _wall_clock(), _cpu_clock()
+        try:
+            yield
+        finally:
+            self.add(stage, _wall_clock() - wall, _cpu_clock() - cpu)
+
+    def add(self, stage, wall, cpu, count=1):
+        totals = self.stages.setdefault(
+                stage, {'wall': 0.0, 'cpu': 0.0, 'count': 0})
+        totals['wall'] += wall
+        totals['cpu'] += cpu
+        totals['count'] += count
+
+    def update(self, timings):
+        """Adds the times of `timings` to this instance.
+
+        :param timings: Timings instance or the dict returned by :meth:`as_dict`.
+        """
+        if isinstance(timings, Timings):
+            timings = timings.stages
+
+        for stage, totals in timings.items():
+            self.add(stage, totals['wall'], totals['cpu'], totals['count'])
+
+    def as_dict(self):
+        return OrderedDict((stage, dict(totals))
+                           for stage, totals in self.stages.items())
+
+    def __len__(self):
+        return len(self.stages)
+
+
+class AhoCorasick(object):
+    """Finds which of `patterns` occur in a text, walking the text only
+    once regardless of the number of patterns.
+
+    Implements the Aho-Corasick string matching automaton.
+
+    :param patterns: iterable of strings.
+    """
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                state = next_state
+            self._output[state].add(pattern)
+
+        self._patterns_count = len(set().union(*self._output))
+
+        # the failure links are computed in breadth-first order, so the
+        # links of the shallower states are known beforehand.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def search(self, text):
+        """Returns the set of patterns found in `text`.
+        """
+        found = set(self._output[0])
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                found |= self._output[state]
+                if len(found) == self._patterns_count:
+                    break
+
+        return found
+
+
 def cachedmethod(wrappee):
     """Caches method calls within known arguments.
     """
@@ -54,6 +251,139 @@ def cachedmethod(wrappee):
     return wrapper
 
 
+def get_default_cache_dir():
+    """Returns the path of the directory where packtools persists its caches.
+
+    The directory follows the XDG Base Directory Specification.
+    """
+    base_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+            os.path.expanduser('~'), '.cache')
+    return os.path.join(base_dir, 'packtools')
+
+
+def write_file_atomically(path, data):
+    """Writes the bytes `data` to `path`, creating intermediate directories.
+
+    Concurrent readers will never see a partially written file.
+    """
+    dirname = os.path.dirname(path)
+    _makedirs(dirname)
+
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+
+
+# Must be incremented whenever the layout of the `ResultCache` database
+# changes.
+RESULT_CACHE_VERSION = 1
+
+
+class ResultCache(object):
+    """Persistent mapping of keys to JSON-serializable results, stored in
+    the SQLite database at `path`.
+
+    Each result is stored along with `fingerprint`, that identifies what,
+    besides the key, the result depends on (e.g. the versions of the
+    software, the schemas and the options). The results of each fingerprint
+    are kept apart, so instances with different fingerprints can share the
+    same database without overwriting each other.
+
+    The database may be shared by many processes.
+
+    :param path: path to the database file.
+    :param fingerprint: string.
+    """
+    def __init__(self, path, fingerprint):
+        dirname = os.path.dirname(path)
+        if dirname:
+            _makedirs(dirname)
+
+        self.path = path
+        self.fingerprint = fingerprint
+
+        self._conn = sqlite3.connect(path, timeout=60)
+        # the write-ahead log allows readers and a writer to work
+        # concurrently, and makes the commits cheap.
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+            if version != RESULT_CACHE_VERSION:
+                # the results are discarded if the layout has changed.
+                self._conn.execute('DROP TABLE IF EXISTS results')
+                self._conn.execute(
+                        'PRAGMA user_version = %d' % RESULT_CACHE_VERSION)
+
+            self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS results ('
+                    'key TEXT NOT NULL, fingerprint TEXT NOT NULL, '
+                    'value TEXT NOT NULL, accessed REAL NOT NULL, '
+                    'PRIMARY KEY (key, fingerprint))')
+
+    def get(self, key, default=None):
+        row = self._conn.execute(
+                'SELECT value FROM results WHERE key = ? AND fingerprint = ?',
+                (key, self.fingerprint)).fetchone()
+        if row is None:
+            return default
+
+        with self._conn:
+            self._conn.execute(
+                    'UPDATE results SET accessed = ? '
+                    'WHERE key = ? AND fingerprint = ?',
+                    (time.time(), key, self.fingerprint))
+
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        with self._conn:
+            self._conn.execute(
+                    'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                    (key, self.fingerprint, json.dumps(value), time.time()))
+
+    def prune(self, max_age, other_fingerprints=False):
+        """Removes the results, of any fingerprint, not accessed in the last
+        `max_age` seconds. Returns the number of removed results.
+
+        :param max_age: age in seconds.
+        :param other_fingerprints: (optional) also removes all results stored
+                                   with fingerprints other than the one of
+                                   the instance.
+        """
+        query = 'DELETE FROM results WHERE accessed < ?'
+        params = [time.time() - max_age]
+        if other_fingerprints:
+            query += ' OR fingerprint != ?'
+            params.append(self.fingerprint)
+
+        with self._conn:
+            removed = self._conn.execute(query, params).rowcount
+
+        self._conn.execute('VACUUM')
+        return removed
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
 def get_static_assets(xml_et):
     """Returns an iterable with all static assets referenced by xml_et.
     """
@@ -73,17 +403,24 @@ def get_static_assets(xml_et):
     return [element.attrib['{http://www.w3.org/1999/xlink}href'] for element in elements]
 
 
-def XML(file, no_network=True, load_dtd=True):
+def XML(file, no_network=True, load_dtd=True, remove_blank_text=True):
     """Parses `file` to produce an etree instance.
 
     The XML can be retrieved given its filesystem path,
     an URL or a file-object.
 
+    Parsing without loading the DTD is much faster, and the document can
+    still be validated against the DTDs bundled with packtools. In that case
+    the blank text nodes can be kept with ``remove_blank_text=False``, and
+    then removed according to the DTD. See :func:`remove_blank_text`.
+
     :param file: Path to the XML file, URL or file-object.
     :param no_network: (optional) prevent network access for external DTD.
     :param load_dtd: (optional) load DTD during parse-time.
+    :param remove_blank_text: (optional) remove the blank text nodes
+                              while parsing.
     """
-    parser = etree.XMLParser(remove_blank_text=True,
+    parser = etree.XMLParser(remove_blank_text=remove_blank_text,
                              load_dtd=load_dtd,
                              no_network=no_network)
     xml = etree.parse(file, parser)
@@ -91,6 +428,50 @@ def XML(file, no_network=True, load_dtd=True):
     return xml
 
 
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+
+def remove_blank_text(xml_et, dtd):
+    """Removes the blank text nodes of elements that, according to `dtd`,
+    can only contain other elements.
+
+    It reproduces the effect of parsing with the option ``remove_blank_text``
+    and the DTD loaded, and is meant to be used with documents parsed
+    by :func:`XML` with ``load_dtd=False``.
+
+    :param xml_et: etree._ElementTree instance.
+    :param dtd: etree.DTD instance.
+    """
+    mixed_content = set()
+    element_content = set()
+    for decl in dtd.iterelements():
+        if decl.type in ('element', 'empty'):
+            element_content.add((decl.prefix, decl.name))
+        else:
+            mixed_content.add((decl.prefix, decl.name))
+    element_content -= mixed_content
+
+    def is_blank(text):
+        return text is not None and not text.strip(' \t\r\n')
+
+    def remove(elem, xml_space):
+        xml_space = elem.get(XML_SPACE, xml_space)
+        decl = (elem.prefix, elem.tag.rpartition('}')[2])
+        strip = xml_space != 'preserve' and decl in element_content
+
+        if strip and is_blank(elem.text):
+            elem.text = None
+
+        for child in elem:
+            if strip and is_blank(child.tail):
+                child.tail = None
+
+            if not callable(child.tag):
+                remove(child, xml_space)
+
+    remove(xml_et.getroot(), 'default')
+
+
 def config_xml_catalog(wrapped):
     """Decorator that wraps the execution of a function, setting-up and
     tearing-down the ``XML_CATALOG_FILES`` environment variable for the current
@@ -152,7 +533,19 @@ def prettify(jsonobj, colorize=True):
     """
 
     json_str = json.dumps(jsonobj, indent=2, sort_keys=True)
-    if colorize and pygments and not sys.platform.startswith('win'):
+    if colorize:
+        return colorize_json(json_str)
+
+    return json_str
+
+
+def colorize_json(json_str):
+    """ Highlight the JSON string `json_str` with ANSI escape sequences.
+
+    Fragments of JSON documents are also accepted. On windows, or if pygments
+    is not installed, `json_str` is returned untouched.
+    """
+    if pygments and not sys.platform.startswith('win'):
         LOGGER.info('using pygments to highlight the output')
         try:
             lexer = get_lexer_for_mimetype("application/json")
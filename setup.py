@@ -59,5 +59,6 @@ setup(
     [console_scripts]
     stylechecker = packtools.stylechecker:main
     htmlgenerator = packtools.htmlgenerator:main
+    packtools-serve = packtools.server:main
     """)
 
@@ -0,0 +1,16 @@
+# coding: utf-8
+import atexit
+import os
+import shutil
+import tempfile
+
+# The tests must not write to the on-disk cache of the user, so the compiled
+# schematron schemas are persisted in a temporary directory that is removed
+# at the end of the run.
+CACHE_DIR = tempfile.mkdtemp(prefix='packtools-tests-')
+os.environ['PACKTOOLS_CACHE_DIR'] = CACHE_DIR
+atexit.register(shutil.rmtree, CACHE_DIR, True)
+
+# in case packtools was imported before the tests package.
+from packtools import domain
+domain.CACHE_DIR = CACHE_DIR
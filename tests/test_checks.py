@@ -419,3 +419,108 @@ class DoctypePipeTests(unittest.TestCase):
 
         self.assertEqual(len(err_list), 0)
 
+
+
+# ----------------------------------
+# Single traversal dispatch tests
+# ----------------------------------
+class PathMatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.et = etree.parse(io.BytesIO(b"""
+        <article>
+          <front><p id="a"/></front>
+          <body>
+            <p id="b"/>
+            <sec><p id="c" content-type="x"/></sec>
+          </body>
+        </article>
+        """))
+
+    def _findall(self, path):
+        matcher = checks.PathMatcher(path)
+        root = self.et.getroot()
+        return [elem.get('id') for elem in root.iter(matcher.tag)
+                if matcher.match(elem, root)]
+
+    def test_child_axis(self):
+        self.assertEqual(self._findall('body/p'), ['b'])
+
+    def test_descendant_axis(self):
+        self.assertEqual(self._findall('body//p'), ['b', 'c'])
+
+    def test_any_depth(self):
+        self.assertEqual(self._findall('.//p'), ['a', 'b', 'c'])
+
+    def test_attribute_presence(self):
+        self.assertEqual(self._findall('.//p[@content-type]'), ['c'])
+
+    def test_attribute_value(self):
+        self.assertEqual(self._findall('.//p[@content-type="x"]'), ['c'])
+        self.assertEqual(self._findall(".//p[@content-type='y']"), [])
+
+    def test_same_results_of_findall(self):
+        for path in ['front/p', 'body//p', 'body/sec/p', './/sec//p', 'p']:
+            self.assertEqual(self._findall(path),
+                             [elem.get('id') for elem in self.et.findall(path)])
+
+    def test_unsupported_paths_raise_ValueError(self):
+        for path in ['', 'body/', '*', 'p[1]', 'p[@xlink:href]']:
+            self.assertRaises(ValueError, lambda: checks.PathMatcher(path))
+
+
+class RunChecksTests(unittest.TestCase):
+
+    def test_elements_are_collected_for_each_check(self):
+        et = etree.parse(io.BytesIO(b'<a><b/><c><b/></c></a>'))
+        collected = []
+
+        @checks.check('b', './/b')
+        def check_foo(et, elements):
+            collected.append(dict((path, len(elems))
+                                  for path, elems in elements.items()))
+            return ['foo']
+
+        @checks.check('c')
+        def check_bar(et, elements):
+            collected.append(dict((path, len(elems))
+                                  for path, elems in elements.items()))
+            return ['bar']
+
+        errors = checks.run_checks(et, [check_foo, check_bar])
+
+        self.assertEqual(errors, ['foo', 'bar'])
+        self.assertEqual(collected, [{'b': 1, './/b': 2}, {'c': 1}])
+
+    def test_tree_is_walked_once(self):
+        et = etree.parse(io.BytesIO(b'<a><b/><c><b/></c></a>'))
+        visitor = checks.TreeVisitor()
+        visited = []
+        visitor.register('.//b', visited.append)
+        visitor.register('c/b', visited.append)
+        visitor.walk(et)
+
+        self.assertEqual([elem.getparent().tag for elem in visited],
+                         ['a', 'c', 'c'])
+
+    def test_pipeline_reports_the_errors_of_all_checks(self):
+        sample = io.BytesIO(b"""
+        <article>
+          <front>
+            <article-meta>
+              <funding-group>
+                <award-group award-type="contract">
+                  <award-id>04/08142-0</award-id>
+                </award-group>
+              </funding-group>
+            </article-meta>
+          </front>
+        </article>
+        """)
+
+        et = etree.parse(sample)
+        err_list = next(checks.StyleCheckingPipeline().run(et, rewrap=True))
+
+        self.assertEqual([err.message for err in err_list], [
+            "Element 'funding-group': This element has occurrences not declared in fn or ack.",
+            "Missing DOCTYPE declaration."])
@@ -2,10 +2,13 @@
 from __future__ import unicode_literals
 import unittest
 import io
-from tempfile import NamedTemporaryFile
+import os
+import argparse
+import shutil
+from tempfile import NamedTemporaryFile, mkdtemp
 from lxml import etree
 
-from packtools import domain
+from packtools import domain, utils, profiling, catalogs, htmlgenerator
 
 
 def setup_tmpfile(method):
@@ -131,3 +134,279 @@ class HTMLGeneratorTests(unittest.TestCase):
 
         self.assertRaises(ValueError, lambda: gen.generate('ru'))
 
+
+
+class HTMLGeneratorGenerateAllTests(unittest.TestCase):
+
+    sample = u"""<article xml:lang="pt">
+                   <front><article-meta><title-group>
+                     <article-title>Título</article-title>
+                   </title-group></article-meta></front>
+                   <sub-article xml:lang="en" article-type="translation" id="S01">
+                     <front-stub><title-group>
+                       <article-title>Title</article-title>
+                     </title-group></front-stub>
+                   </sub-article>
+                   <sub-article xml:lang="es" article-type="translation" id="S02">
+                     <front-stub><title-group>
+                       <article-title>Título</article-title>
+                     </title-group></front-stub>
+                   </sub-article>
+                </article>
+             """
+
+    def setUp(self):
+        self.render_threads = domain.HTML_RENDER_THREADS
+        domain.HTML_RENDER_THREADS = 3
+
+    def tearDown(self):
+        domain.HTML_RENDER_THREADS = self.render_threads
+
+    def test_same_results_of_the_iteration(self):
+        et = etree.parse(io.BytesIO(self.sample.encode('utf-8')))
+        gen = domain.HTMLGenerator.parse(et, valid_only=False)
+
+        self.assertEqual(
+            [(lang, etree.tostring(html)) for lang, html in gen.generate_all()],
+            [(lang, etree.tostring(html)) for lang, html in gen])
+
+    def test_xslt_copies_are_owned_by_each_thread(self):
+        xslt = domain.XSLT('root-html-1.2.xslt')
+        copies = domain._get_render_pool().map(
+                lambda _: domain._get_thread_xslt('root-html-1.2.xslt'),
+                range(30))
+
+        self.assertNotIn(id(xslt), [id(copy) for copy in copies])
+        self.assertIs(domain._get_thread_xslt('root-html-1.2.xslt'),
+                      domain._get_thread_xslt('root-html-1.2.xslt'))
+
+    def test_custom_xslts_are_run_sequentially(self):
+        xslt = etree.XSLT(etree.XML(
+            b'<xsl:stylesheet version="1.0" '
+            b'xmlns:xsl="http://www.w3.org/1999/XSL/Transform">'
+            b'<xsl:template match="/"><html/></xsl:template>'
+            b'</xsl:stylesheet>'))
+        et = etree.parse(io.BytesIO(self.sample.encode('utf-8')))
+        gen = domain.HTMLGenerator.parse(et, valid_only=False, xslt=xslt)
+
+        self.assertEqual(
+            [(lang, etree.tostring(html)) for lang, html in gen.generate_all()],
+            [(lang, b'<html/>') for lang in ['pt', 'en', 'es']])
+
+
+class HTMLGeneratorRenderCacheTests(unittest.TestCase):
+
+    sample = HTMLGeneratorGenerateAllTests.sample
+
+    def _make_generator(self, sample=None, **kwargs):
+        et = etree.parse(io.BytesIO((sample or self.sample).encode('utf-8')))
+        return domain.HTMLGenerator.parse(et, valid_only=False, **kwargs)
+
+    def test_same_results_of_generate(self):
+        gen = self._make_generator(render_cache=utils.LRUCache(10))
+
+        self.assertEqual(gen.render('en'),
+                         etree.tostring(gen.generate('en'), pretty_print=True,
+                                        encoding='utf-8', method='html',
+                                        doctype='<!DOCTYPE html>'))
+
+    def test_cache_hits_skip_the_xslt(self):
+        cache = utils.LRUCache(10)
+        html = self._make_generator(render_cache=cache).render('en')
+
+        gen = self._make_generator(render_cache=cache)
+        gen.xslt = None
+        gen._generate = None
+        self.assertEqual(gen.render('en'), html)
+
+    def test_keys_depend_on_the_xslt_params(self):
+        cache = utils.LRUCache(10)
+        gen = self._make_generator(render_cache=cache)
+        gen.render('en')
+        gen.render('es')
+        self._make_generator(render_cache=cache, css='style.css').render('en')
+
+        self.assertEqual(len(cache), 3)
+
+    def test_keys_depend_on_the_xml(self):
+        cache = utils.LRUCache(10)
+        self._make_generator(render_cache=cache).render('en')
+        self._make_generator(self.sample.replace('Title', 'Other title'),
+                             render_cache=cache).render('en')
+
+        self.assertEqual(len(cache), 2)
+
+    def test_custom_xslt_cannot_be_cached(self):
+        xslt = etree.XSLT(etree.XML(
+            b'<xsl:stylesheet version="1.0" '
+            b'xmlns:xsl="http://www.w3.org/1999/XSL/Transform"/>'))
+
+        self.assertRaises(ValueError, self._make_generator, xslt=xslt,
+                          render_cache=utils.LRUCache(10))
+
+
+class HTMLGeneratorValidityTests(unittest.TestCase):
+
+    sample = u"""<article xml:lang="pt" specific-use="sps-1.5">
+                   <front><article-meta><title-group>
+                     <article-title>%s</article-title>
+                   </title-group></article-meta></front>
+                </article>
+             """
+
+    def setUp(self):
+        self.validate_all = domain.XMLValidator.validate_all
+        self.calls = []
+
+        def validate_all(validator, fail_fast=False):
+            self.calls.append(validator)
+            return True, []
+
+        domain.XMLValidator.validate_all = validate_all
+
+    def tearDown(self):
+        domain.XMLValidator.validate_all = self.validate_all
+
+    def _make_xml(self, title):
+        return etree.parse(io.BytesIO((self.sample % title).encode('utf-8')))
+
+    def test_validator_results_are_reused(self):
+        validator = domain.XMLValidator.parse(self._make_xml('Foo'),
+                                              no_doctype=True)
+        gen = domain.HTMLGenerator.parse(validator)
+
+        self.assertIs(gen.lxml, validator.lxml)
+        self.assertEqual(self.calls, [validator])
+
+    def test_invalid_validator_results(self):
+        validator = domain.XMLValidator.parse(self._make_xml('Foo'),
+                                              no_doctype=True)
+        validator.validate_all = lambda: (False, [])
+
+        self.assertRaises(ValueError, domain.HTMLGenerator.parse, validator)
+
+    def test_known_validation_status(self):
+        # the XML is not even accepted by XMLValidator.parse
+        et = self._make_xml('Foo')
+
+        self.assertIs(domain.HTMLGenerator.parse(et, is_valid=True).lxml, et)
+        self.assertRaises(ValueError, domain.HTMLGenerator.parse, et,
+                          is_valid=False)
+        self.assertEqual(self.calls, [])
+
+    def test_validity_is_memoized_by_content(self):
+        xml = (u'<!DOCTYPE article PUBLIC "-//NLM//DTD JATS (Z39.96) Journal '
+               u'Publishing DTD v1.0 20120330//EN" '
+               u'"JATS-journalpublishing1.dtd">' + self.sample % 'Memoized')
+        for _ in range(2):
+            domain.HTMLGenerator.parse(
+                    etree.parse(io.BytesIO(xml.encode('utf-8'))))
+
+        self.assertEqual(len(self.calls), 1)
+
+
+class HTMLGeneratorProfileTests(unittest.TestCase):
+
+    sample = HTMLGeneratorGenerateAllTests.sample
+
+    def test_transformations_are_profiled(self):
+        et = etree.parse(io.BytesIO(self.sample.encode('utf-8')))
+        profile = profiling.XSLTProfile(
+                catalogs.XSLTS['root-html-1.2.xslt'])
+        gen = domain.HTMLGenerator.parse(et, valid_only=False,
+                                         profile=profile)
+        plain_gen = domain.HTMLGenerator.parse(et, valid_only=False)
+
+        self.assertEqual(
+            [(lang, etree.tostring(html)) for lang, html in gen.generate_all()],
+            [(lang, etree.tostring(html)) for lang, html in plain_gen])
+        self.assertEqual(profile.transformations, 3)
+
+
+class HTMLGeneratorCLITests(unittest.TestCase):
+
+    sample = HTMLGeneratorGenerateAllTests.sample
+
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.xmls = []
+        for name in 'abcd':
+            path = os.path.join(self.tmp_dir, name + '.xml')
+            with open(path, 'wb') as fp:
+                fp.write(self.sample.replace('Title', name).encode('utf-8'))
+            self.xmls.append(path)
+
+        broken = os.path.join(self.tmp_dir, 'broken.xml')
+        with open(broken, 'wb') as fp:
+            fp.write(b'<article')
+        self.xmls.insert(2, broken)
+
+        # the HTML cannot be generated without the language of the document
+        no_lang = os.path.join(self.tmp_dir, 'nolang.xml')
+        with open(no_lang, 'wb') as fp:
+            fp.write(b'<article><sub-article xml:lang="en" '
+                     b'article-type="translation"/></article>')
+        self.xmls.insert(3, no_lang)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _process(self, **kwargs):
+        options = dict(nonetwork=True, nochecks=True, css=None,
+                       rendercache=None, jobs=1)
+        options.update(kwargs)
+        results = []
+        for xml, out_fnames, error, _ in htmlgenerator._process_xmls(
+                self.xmls, argparse.Namespace(**options)):
+            htmls = []
+            for out_fname in out_fnames:
+                with open(out_fname, 'rb') as fp:
+                    htmls.append((out_fname, fp.read()))
+                os.remove(out_fname)
+
+            results.append((xml, htmls, error))
+
+        return results
+
+    def test_parallel_results_match_the_sequential_ones(self):
+        sequential = self._process()
+        parallel = self._process(jobs=2)
+
+        self.assertEqual(parallel, sequential)
+        self.assertEqual([result[0] for result in parallel], self.xmls)
+        self.assertEqual([os.path.basename(out_fname)
+                          for out_fname, _ in parallel[0][1]],
+                         ['a.pt.html', 'a.en.html', 'a.es.html'])
+
+    def test_failing_documents_do_not_abort_the_batch(self):
+        results = self._process(jobs=2)
+
+        for failing in results[2:4]:
+            self.assertEqual(failing[1], [])
+            self.assertIsNotNone(failing[2])
+        self.assertEqual(len(results[-1][1]), 3)
+
+    def test_render_cache_hits_skip_parsing_and_validation(self):
+        cache_dir = os.path.join(self.tmp_dir, 'cache')
+        expected = self._process(rendercache=cache_dir)
+
+        def get_htmlgenerator(*args, **kwargs):
+            raise AssertionError('the XML should not be parsed')
+
+        original = htmlgenerator.get_htmlgenerator
+        htmlgenerator.get_htmlgenerator = get_htmlgenerator
+        try:
+            self.xmls = [self.xmls[0], self.xmls[-1]]
+            results = self._process(rendercache=cache_dir)
+        finally:
+            htmlgenerator.get_htmlgenerator = original
+
+        self.assertEqual(results, [expected[0], expected[-1]])
+
+    def test_render_cache_keys_depend_on_the_options(self):
+        cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self._process(rendercache=cache_dir)
+
+        results = self._process(rendercache=cache_dir, css='style.css')
+
+        self.assertEqual(results, self._process(css='style.css'))
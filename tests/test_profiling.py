@@ -0,0 +1,122 @@
+# coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import io
+
+from lxml import etree, isoschematron
+
+from packtools import profiling
+
+
+sample_sch = b'''\
+<schema xmlns="http://purl.oclc.org/dsdl/schematron">
+  <pattern id="sum_equals_100_percent">
+    <rule context="Total">
+      <assert test="sum(//Percent)=100">Sum is not 100%.</assert>
+    </rule>
+  </pattern>
+  <pattern id="percent_notempty">
+    <rule context="Percent">
+      <assert test="string-length(normalize-space(.)) != 0">Empty percent.</assert>
+    </rule>
+  </pattern>
+</schema>
+'''
+
+
+def make_schematron(**kwargs):
+    return isoschematron.Schematron(etree.parse(io.BytesIO(sample_sch)),
+                                    **kwargs)
+
+
+class SchematronProfileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.xml = etree.parse(io.BytesIO(
+            b'<Total><Percent>70</Percent><Percent>30</Percent></Total>'))
+
+    def test_schematron_without_the_xslt_raises_ValueError(self):
+        self.assertRaises(ValueError,
+                lambda: profiling.SchematronProfile(make_schematron()))
+
+    def test_run_returns_the_svrl_report(self):
+        profile = profiling.SchematronProfile(make_schematron(store_xslt=True))
+        report = profile.run(self.xml)
+
+        self.assertEqual(report.getroot().tag,
+                         '{http://purl.oclc.org/dsdl/svrl}schematron-output')
+
+    def test_rules_are_reported_with_their_patterns(self):
+        profile = profiling.SchematronProfile(make_schematron(store_xslt=True))
+        profile.run(self.xml)
+
+        rules = dict(((pattern_id, context), calls)
+                     for pattern_id, context, time, calls in profile.rules())
+        self.assertEqual(rules, {('sum_equals_100_percent', 'Total'): 1,
+                                 ('percent_notempty', 'Percent'): 2})
+
+    def test_calls_are_accumulated_across_documents(self):
+        profile = profiling.SchematronProfile(make_schematron(store_xslt=True))
+        for _ in range(3):
+            profile.run(self.xml)
+
+        patterns = dict((pattern_id, fired)
+                        for pattern_id, time, fired in profile.patterns())
+        self.assertEqual(profile.documents, 3)
+        self.assertEqual(patterns['sum_equals_100_percent'], 3)
+        self.assertEqual(patterns['percent_notempty'], 6)
+
+    def test_report(self):
+        profile = profiling.SchematronProfile(make_schematron(store_xslt=True))
+        profile.run(self.xml)
+
+        report = profile.report()
+        self.assertTrue(report.startswith('1 documents'))
+        self.assertIn('percent_notempty: Percent', report)
+
+
+sample_xslt = b'''\
+<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+  <xsl:param name="greeting"/>
+  <xsl:template match="/">
+    <html><xsl:apply-templates select="//Percent"/></html>
+  </xsl:template>
+  <xsl:template match="Percent">
+    <p><xsl:value-of select="$greeting"/><xsl:value-of select="."/></p>
+  </xsl:template>
+</xsl:stylesheet>
+'''
+
+
+class XSLTProfileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.xml = etree.parse(io.BytesIO(
+            b'<Total><Percent>70</Percent><Percent>30</Percent></Total>'))
+        self.xslt = etree.parse(io.BytesIO(sample_xslt))
+
+    def test_run_returns_the_result_of_the_transformation(self):
+        profile = profiling.XSLTProfile(self.xslt)
+        result = profile.run(self.xml, greeting=etree.XSLT.strparam('n='))
+
+        self.assertEqual(etree.tostring(result),
+                         etree.tostring(etree.XSLT(self.xslt)(
+                             self.xml, greeting=etree.XSLT.strparam('n='))))
+
+    def test_calls_are_accumulated_across_transformations(self):
+        profile = profiling.XSLTProfile(self.xslt)
+        for _ in range(3):
+            profile.run(self.xml)
+
+        calls = dict(((label, mode), calls)
+                     for label, mode, time, calls in profile.ranking())
+        self.assertEqual(calls, {('/', ''): 3, ('Percent', ''): 6})
+        self.assertEqual(profile.transformations, 3)
+
+    def test_report_lists_the_templates(self):
+        profile = profiling.XSLTProfile(self.xslt)
+        profile.run(self.xml)
+
+        report = profile.report()
+        self.assertTrue(report.startswith('1 transformations'))
+        self.assertIn('Percent', report)
@@ -2664,6 +2664,76 @@ class XrefRidTests(PhaseBasedTestCase):
         self.assertFalse(self._run_validation(sample))
 
 
+class XrefRidKeysTests(unittest.TestCase):
+    """Tests for the keys used to resolve //xref[@rid] of each @ref-type.
+    """
+    cache = {}
+
+    def _mismatching_rids(self, sample):
+        if 'schematron' not in self.cache:
+            self.cache['schematron'] = isoschematron.Schematron(
+                    SCH, store_report=True)
+
+        schematron = self.cache['schematron']
+        schematron.validate(etree.parse(io.BytesIO(sample.encode('utf-8'))))
+        messages = schematron.validation_report.iterfind(
+                '//{http://purl.oclc.org/dsdl/svrl}failed-assert')
+        return [' '.join(''.join(message.itertext()).split())
+                for message in messages
+                if 'Mismatching id value' in ''.join(message.itertext())]
+
+    def test_bibr_matching_element_citation(self):
+        sample = u"""<article>
+                      <body>
+                        <p><xref ref-type="bibr" rid="B1">1</xref></p>
+                      </body>
+                      <back>
+                        <ref-list>
+                          <ref>
+                            <element-citation id="B1" publication-type="book"/>
+                          </ref>
+                        </ref-list>
+                      </back>
+                    </article>
+                 """
+        self.assertEqual(self._mismatching_rids(sample), [])
+
+    def test_fig_matching_fig_group(self):
+        sample = u"""<article>
+                      <body>
+                        <fig-group id="f1"/>
+                        <p><xref ref-type="fig" rid="f1">1</xref></p>
+                      </body>
+                    </article>
+                 """
+        self.assertEqual(self._mismatching_rids(sample), [])
+
+    def test_table_fn_matching_fn_in_table_wrap_foot(self):
+        sample = u"""<article>
+                      <body>
+                        <table-wrap id="t1">
+                          <table-wrap-foot><fn id="tfn1"/></table-wrap-foot>
+                        </table-wrap>
+                        <p><xref ref-type="table-fn" rid="tfn1">*</xref></p>
+                      </body>
+                    </article>
+                 """
+        self.assertEqual(self._mismatching_rids(sample), [])
+
+    def test_table_fn_mismatching_fn_outside_table_wrap_foot(self):
+        sample = u"""<article>
+                      <body>
+                        <p><xref ref-type="table-fn" rid="fn1">*</xref></p>
+                      </body>
+                      <back>
+                        <fn-group><fn id="fn1"/></fn-group>
+                      </back>
+                    </article>
+                 """
+        self.assertEqual(self._mismatching_rids(sample), [
+            "Element 'xref', attribute rid: Mismatching id value 'fn1' of type 'table-fn'."])
+
+
 class XrefRefTypeTests(PhaseBasedTestCase):
     """Tests for //xref[@ref-type]
     """
@@ -0,0 +1,142 @@
+# coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import json
+import socket
+import threading
+try:
+    from http.client import HTTPConnection
+except ImportError:  # py2
+    from httplib import HTTPConnection
+
+from packtools import server
+
+
+sample_xml = b'''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE article PUBLIC "-//NLM//DTD JATS (Z39.96) Journal Publishing DTD v1.0 20120330//EN" "JATS-journalpublishing1.dtd">
+<article xmlns:xlink="http://www.w3.org/1999/xlink" article-type="research-article" dtd-version="1.0" specific-use="sps-1.5" xml:lang="en">
+  <front>
+    <article-meta>
+      <title-group>
+        <article-title>Title</article-title>
+      </title-group>
+    </article-meta>
+  </front>
+</article>
+'''
+
+OPTIONS = {
+    'extra_sch': None,
+    'cached_dtd': True,
+    'phases': None,
+    'no_checks': True,
+    'css': None,
+}
+
+
+def start_server(workers=1, backlog=1, **kwargs):
+    """Starts a server on an ephemeral port, and returns it.
+    """
+    httpd = server.Server(('127.0.0.1', 0), workers, backlog, OPTIONS, **kwargs)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return httpd
+
+
+def stop_server(httpd):
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class ServerTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = start_server(max_request_size=len(sample_xml))
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_server(cls.httpd)
+
+    def _request(self, method, path, body=None, headers=None):
+        conn = HTTPConnection('127.0.0.1', self.httpd.server_address[1],
+                              timeout=60)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+    def test_status(self):
+        status, body = self._request('GET', '/status')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode('utf-8'))['status'], 'ok')
+
+    def test_unknown_paths(self):
+        self.assertEqual(self._request('GET', '/foo')[0], 404)
+        self.assertEqual(self._request('POST', '/foo', b'')[0], 404)
+
+    def test_validate(self):
+        status, body = self._request('POST', '/validate', sample_xml)
+
+        self.assertEqual(status, 200)
+        summary = json.loads(body.decode('utf-8'))
+        self.assertFalse(summary['is_valid'])
+        self.assertTrue(summary['sps_errors'])
+
+    def test_validate_malformed_xml(self):
+        status, body = self._request('POST', '/validate', b'<article')
+
+        self.assertEqual(status, 400)
+        self.assertIn('error', json.loads(body.decode('utf-8')))
+
+    def test_html(self):
+        status, body = self._request('POST', '/html?lang=en', sample_xml)
+
+        self.assertEqual(status, 200)
+        self.assertTrue(body.startswith(b'<!DOCTYPE html>'))
+
+    def test_html_unknown_language(self):
+        self.assertEqual(
+                self._request('POST', '/html?lang=xx', sample_xml)[0], 400)
+
+    def test_too_large_xml(self):
+        status, _ = self._request('POST', '/validate', sample_xml + b' ')
+
+        self.assertEqual(status, 413)
+
+    def test_invalid_content_length(self):
+        for length in ('-1', 'foo'):
+            status, _ = self._request('POST', '/validate', None,
+                                      {'Content-Length': length})
+            self.assertEqual(status, 400)
+
+
+class ServerBackpressureTests(unittest.TestCase):
+
+    def setUp(self):
+        self.httpd = start_server(workers=1, backlog=0)
+
+    def tearDown(self):
+        stop_server(self.httpd)
+
+    def test_requests_in_excess_are_rejected(self):
+        # holds the only slot, since the server waits for the body
+        blocking = socket.create_connection(self.httpd.server_address)
+        try:
+            blocking.sendall(b'POST /validate HTTP/1.0\r\n'
+                             b'Content-Length: 10\r\n\r\n')
+            # the connections are accepted in order, so the slot is taken
+            # before the next request is handled.
+            conn = HTTPConnection('127.0.0.1', self.httpd.server_address[1],
+                                  timeout=60)
+            conn.request('GET', '/status')
+            response = conn.getresponse()
+            self.assertEqual(response.status, 503)
+            self.assertEqual(response.getheader('Retry-After'), '1')
+            conn.close()
+        finally:
+            blocking.close()
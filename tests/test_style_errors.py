@@ -3,11 +3,29 @@ from __future__ import unicode_literals
 import unittest
 import io
 
-from lxml import etree
+from lxml import etree, isoschematron
 
 from packtools import style_errors
 
 
+sample_sch = b'''\
+<schema xmlns="http://purl.oclc.org/dsdl/schematron">
+  <pattern id="sum_equals_100_percent">
+    <title>Sum equals 100%.</title>
+    <rule context="Total">
+      <assert test="sum(//Percent)=100" role="error">Element 'Total': Sum is not 100%.</assert>
+    </rule>
+  </pattern>
+  <pattern id="two_elements">
+    <title>Max 2 elements allowed.</title>
+    <rule context="Total">
+      <assert test="count(//Percent) &lt; 3">Element 'Total': More than 2 elements.</assert>
+    </rule>
+  </pattern>
+</schema>
+'''
+
+
 class ElementNamePatternTests(unittest.TestCase):
     pattern = style_errors.EXPOSE_ELEMENTNAME_PATTERN
 
@@ -51,3 +69,165 @@ class SearchElementFunctionTests(unittest.TestCase):
         fp = etree.parse(io.BytesIO(b'<a>\n<b>bar</b>\n</a>'))
         self.assertRaises(ValueError, lambda: style_errors.search_element(fp, 'c', 2))
 
+
+
+class ElementIndexTests(unittest.TestCase):
+
+    def test_element_at_line(self):
+        fp = etree.parse(io.BytesIO(b'<a>\n<b>bar</b>\n<c/><d/>\n</a>'))
+        index = style_errors.ElementIndex(fp)
+
+        self.assertEqual(index.element_at_line(1).tag, 'a')
+        self.assertEqual(index.element_at_line(2).tag, 'b')
+
+    def test_first_element_of_the_line_is_indexed(self):
+        fp = etree.parse(io.BytesIO(b'<a>\n<b>bar</b>\n<c/><d/>\n</a>'))
+        index = style_errors.ElementIndex(fp)
+
+        self.assertEqual(index.element_at_line(3).tag, 'c')
+
+    def test_missing_line(self):
+        fp = etree.parse(io.BytesIO(b'<a>\n<b>bar</b>\n</a>'))
+        index = style_errors.ElementIndex(fp)
+
+        self.assertRaises(ValueError, lambda: index.element_at_line(10))
+
+
+class SchemaStyleErrorTests(unittest.TestCase):
+
+    def _make_error(self, line):
+        class DummyError(object):
+            message = "Element 'c': This element is not expected."
+        err = DummyError()
+        err.line = line
+        return style_errors.SchemaStyleError(err)
+
+    def test_get_apparent_element(self):
+        fp = etree.parse(io.BytesIO(b'<a>\n<b>bar</b>\n<c/>\n</a>'))
+        error = self._make_error(3)
+
+        self.assertEqual(error.get_apparent_element(fp).tag, 'c')
+
+    def test_get_apparent_element_using_index(self):
+        fp = etree.parse(io.BytesIO(b'<a>\n<b>bar</b>\n<c/>\n</a>'))
+        index = style_errors.ElementIndex(fp)
+        error = self._make_error(3)
+
+        self.assertEqual(error.get_apparent_element(fp, index=index).tag, 'c')
+
+    def test_get_apparent_element_missing_line(self):
+        fp = etree.parse(io.BytesIO(b'<a>\n<b>bar</b>\n<c/>\n</a>'))
+        error = self._make_error(10)
+
+        self.assertRaises(ValueError, lambda: error.get_apparent_element(fp))
+
+
+class ElementIndexByTagTests(unittest.TestCase):
+    sample = b'<a>\n<b>foo</b>\n<c/><b>bar</b>\n<!-- comment -->\n</a>'
+
+    def test_elements_by_tag(self):
+        fp = etree.parse(io.BytesIO(self.sample))
+        index = style_errors.ElementIndex(fp)
+
+        self.assertEqual([elem.text for elem in index.elements_by_tag('b')],
+                         ['foo', 'bar'])
+
+    def test_elements_by_unknown_tag(self):
+        fp = etree.parse(io.BytesIO(self.sample))
+        index = style_errors.ElementIndex(fp)
+
+        self.assertEqual(index.elements_by_tag('z'), [])
+
+    def test_find_element(self):
+        fp = etree.parse(io.BytesIO(self.sample))
+        index = style_errors.ElementIndex(fp)
+
+        self.assertEqual(index.find_element('b').text, 'foo')
+        self.assertEqual(index.find_element('b', 3).text, 'bar')
+
+    def test_find_element_is_equivalent_to_search_element(self):
+        fp = etree.parse(io.BytesIO(self.sample))
+        index = style_errors.ElementIndex(fp)
+
+        for tagname, line in [('a', None), ('a', 1), ('b', 2), ('c', 3)]:
+            self.assertIs(index.find_element(tagname, line),
+                          style_errors.search_element(fp, '//' + tagname, line))
+
+    def test_find_missing_element(self):
+        fp = etree.parse(io.BytesIO(self.sample))
+        index = style_errors.ElementIndex(fp)
+
+        self.assertRaises(ValueError, lambda: index.find_element('b', 4))
+        self.assertRaises(ValueError, lambda: index.find_element('z'))
+
+
+class StyleErrorTests(unittest.TestCase):
+
+    def test_get_apparent_element_using_index(self):
+        fp = etree.parse(io.BytesIO(b'<a>\n<b>foo</b>\n<b>bar</b>\n</a>'))
+        index = style_errors.ElementIndex(fp)
+
+        error = style_errors.StyleError()
+        error.message = "Element 'b': Some error."
+        error.line = 3
+
+        self.assertEqual(error.get_apparent_element(fp, index=index).text, 'bar')
+
+
+class SchematronStyleErrorTests(unittest.TestCase):
+    sample = b'<Total>\n<Percent>60</Percent>\n<Percent>20</Percent>\n<Percent>10</Percent>\n</Total>'
+
+    def _validate(self, **kwargs):
+        schematron = isoschematron.Schematron(
+                etree.parse(io.BytesIO(sample_sch)), **kwargs)
+        schematron.validate(etree.parse(io.BytesIO(self.sample)))
+        return schematron
+
+    def test_errors_from_the_report(self):
+        schematron = self._validate(store_report=True)
+        errors = style_errors.make_schematron_errors(schematron)
+
+        self.assertEqual([err.message for err in errors],
+                         ["Element 'Total': Sum is not 100%.",
+                          "Element 'Total': More than 2 elements."])
+        self.assertEqual([err.pattern_id for err in errors],
+                         ['sum_equals_100_percent', 'two_elements'])
+
+    def test_errors_from_the_error_log(self):
+        schematron = self._validate()
+        errors = style_errors.make_schematron_errors(schematron)
+
+        self.assertEqual([err.message for err in errors],
+                         ["Element 'Total': Sum is not 100%.",
+                          "Element 'Total': More than 2 elements."])
+        self.assertEqual([err.pattern_id for err in errors], [None, None])
+
+    def test_structured_fields(self):
+        schematron = self._validate(store_report=True)
+        error = style_errors.make_schematron_errors(schematron)[0]
+
+        self.assertEqual(error.location, '/Total')
+        self.assertEqual(error.test, 'sum(//Percent)=100')
+        self.assertEqual(error.role, 'error')
+
+    def test_init_with_error_log_entry(self):
+        schematron = self._validate()
+        error = style_errors.SchematronStyleError(schematron.error_log[0])
+
+        self.assertEqual(error.message, "Element 'Total': Sum is not 100%.")
+        self.assertEqual(error.location, '/Total')
+
+    def test_get_apparent_element(self):
+        doc = etree.parse(io.BytesIO(self.sample))
+        schematron = self._validate(store_report=True)
+        error = style_errors.make_schematron_errors(schematron)[0]
+
+        self.assertEqual(error.get_apparent_element(doc).tag, 'Total')
+
+    def test_no_errors(self):
+        schematron = isoschematron.Schematron(
+                etree.parse(io.BytesIO(sample_sch)), store_report=True)
+        schematron.validate(etree.parse(io.BytesIO(
+            b'<Total><Percent>100</Percent></Total>')))
+
+        self.assertEqual(style_errors.make_schematron_errors(schematron), [])
@@ -0,0 +1,303 @@
+# coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import argparse
+import io
+import os
+import gzip
+import json
+import shutil
+import zipfile
+from tempfile import mkdtemp
+
+from packtools import stylechecker, utils
+
+
+sample_xml = b'''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE article PUBLIC "-//NLM//DTD JATS (Z39.96) Journal Publishing DTD v1.0 20120330//EN" "JATS-journalpublishing1.dtd">
+<article xmlns:xlink="http://www.w3.org/1999/xlink" article-type="research-article" dtd-version="1.0" specific-use="sps-1.5" xml:lang="en">
+  <front>
+    <article-meta>
+      <title-group>
+        <article-title>%s</article-title>
+      </title-group>
+    </article-meta>
+  </front>
+</article>
+'''
+
+
+def make_args(**kwargs):
+    """Returns the command line args of stylechecker with their default
+    values, except the ones in `kwargs`.
+    """
+    args = dict(annotated=False, raw=False, nonetwork=True, cacheddtd=True,
+                assetsdir=None, extrasch=None, jobs=1, unordered=False,
+                timings=False, phases=None, resultcache=None,
+                resultcache_bypass=False)
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+class StylecheckerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def make_xml(self, name, content=None):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as fp:
+            fp.write(content if content is not None else
+                     sample_xml % name.encode('utf-8'))
+
+        return path
+
+
+class ResultCacheTests(StylecheckerTestCase):
+
+    def setUp(self):
+        super(ResultCacheTests, self).setUp()
+        self.cache_path = os.path.join(self.tmp_dir, 'cache', 'results.sqlite3')
+
+    def tearDown(self):
+        for cache in stylechecker._get_result_cache.cache.values():
+            cache.close()
+        stylechecker._get_result_cache.cache.clear()
+        super(ResultCacheTests, self).tearDown()
+
+    def _validate(self, xml, **kwargs):
+        return stylechecker._process_xml(
+                xml, make_args(resultcache=self.cache_path, **kwargs))[1]
+
+    def test_results_of_each_option_set_are_kept_apart(self):
+        xml = self.make_xml('a.xml')
+        full = self._validate(xml)
+        metadata_only = self._validate(xml, phases=['metadata-only'])
+        self.assertNotEqual(full['sps_errors'], metadata_only['sps_errors'])
+
+        # both results are reused, instead of the last one overwriting
+        # the first.
+        cache = stylechecker._get_result_cache(make_args(
+            resultcache=self.cache_path))
+        cache_key = stylechecker._result_cache_key(
+                xml, os.listdir(os.path.dirname(xml)))
+        self.assertEqual(cache.get(cache_key)['sps_errors'],
+                         full['sps_errors'])
+
+        metadata_cache = stylechecker._get_result_cache(make_args(
+            resultcache=self.cache_path, phases=['metadata-only']))
+        self.assertEqual(metadata_cache.get(cache_key)['sps_errors'],
+                         metadata_only['sps_errors'])
+
+    def test_prune_keeps_the_results_of_other_option_sets(self):
+        xml = self.make_xml('a.xml')
+        self._validate(xml, phases=['metadata-only'])
+
+        cache = stylechecker._get_result_cache(make_args(
+            resultcache=self.cache_path))
+        self.assertEqual(cache.prune(30 * 24 * 60 * 60), 0)
+        self.assertEqual(len(cache), 1)
+
+
+summaries = [
+    {'_xml': 'a.xml', 'dtd_errors': [], 'is_valid': True, 'sps_errors': [],
+     'assets': ['a.jpg']},
+    {'_xml': 'b.xml', 'dtd_errors': [], 'is_valid': False,
+     'sps_errors': [{'message': 'Element "x": foo, bar {}',
+                     'apparent_line': None, 'level': 'ERROR'}]},
+    {'_xml': 'c.xml', 'dtd_errors': [{'message': 'Título', 'line': 3}],
+     'is_valid': False, 'sps_errors': []},
+]
+
+
+class PrettyJSONWriterTests(unittest.TestCase):
+
+    def _write(self, items, colorize):
+        output = io.StringIO()
+        writer = stylechecker.PrettyJSONWriter(output, colorize=colorize)
+        for item in items:
+            writer.write(item)
+        writer.close()
+
+        return output.getvalue()
+
+    def _prettify(self, items, colorize):
+        # the same output of `print(prettify(items))`
+        return utils.prettify(items, colorize=colorize) + '\n'
+
+    def test_same_output_of_prettify(self):
+        for count in range(1, len(summaries) + 1):
+            self.assertEqual(self._write(summaries[:count], False),
+                             self._prettify(summaries[:count], False))
+
+    def test_same_output_of_prettify_colorized(self):
+        for count in range(1, len(summaries) + 1):
+            self.assertEqual(self._write(summaries[:count], True),
+                             self._prettify(summaries[:count], True))
+
+    def test_nothing_is_written_without_summaries(self):
+        self.assertEqual(self._write([], False), '')
+
+    def test_summaries_are_written_as_received(self):
+        output = io.StringIO()
+        writer = stylechecker.PrettyJSONWriter(output)
+        writer.write(summaries[0])
+
+        self.assertIn('"a.xml"', output.getvalue())
+
+
+class NDJSONWriterTests(unittest.TestCase):
+
+    def test_one_summary_per_line(self):
+        output = io.StringIO()
+        writer = stylechecker.NDJSONWriter(output)
+        for summary in summaries:
+            writer.write(summary)
+        writer.close()
+
+        lines = output.getvalue().split('\n')
+        self.assertEqual(lines[-1], '')
+        self.assertEqual([json.loads(line) for line in lines[:-1]],
+                         summaries)
+
+
+class OpenOutputTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, path):
+        output = stylechecker._open_output(path)
+        writer = stylechecker.NDJSONWriter(output)
+        for summary in summaries:
+            writer.write(summary)
+        writer.close()
+        output.close()
+
+    def test_plain_text(self):
+        path = os.path.join(self.tmp_dir, 'results.ndjson')
+        self._write(path)
+
+        with io.open(path, encoding='utf-8') as fp:
+            self.assertEqual([json.loads(line) for line in fp], summaries)
+
+    def test_gzip_compressed(self):
+        path = os.path.join(self.tmp_dir, 'results.ndjson.gz')
+        self._write(path)
+
+        with gzip.open(path, 'rb') as fp:
+            lines = fp.read().decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], summaries)
+
+
+class ValidateZipPackageTests(StylecheckerTestCase):
+
+    def setUp(self):
+        super(ValidateZipPackageTests, self).setUp()
+        self.package = os.path.join(self.tmp_dir, 'package.zip')
+        with zipfile.ZipFile(self.package, 'w') as package:
+            for name in ['a', 'b', 'c', 'd', 'e']:
+                package.writestr(name + '.xml', sample_xml % name.encode('utf-8'))
+            package.writestr('broken.xml', b'<article')
+            package.writestr('nodoctype.xml', b'<article specific-use="sps-1.5"/>')
+            package.writestr('a.jpg', b'')
+
+    def test_parallel_reports_match_the_sequential_ones(self):
+        sequential = list(stylechecker.validate_zip_package(self.package))
+        parallel = list(stylechecker.validate_zip_package(self.package,
+                                                          jobs=2))
+
+        self.assertEqual(parallel, sequential)
+        self.assertEqual([report[0] for report in parallel],
+                         ['a.xml', 'b.xml', 'c.xml', 'd.xml', 'e.xml',
+                          'broken.xml', 'nodoctype.xml'])
+
+    def test_failing_documents_do_not_abort_the_batch(self):
+        reports = dict((report[0], report) for report in
+                       stylechecker.validate_zip_package(self.package, jobs=2))
+
+        self.assertEqual(reports['broken.xml'][1:3],
+                         (None, 'XMLSyntaxError'))
+        self.assertEqual(reports['nodoctype.xml'][1:3],
+                         (None, 'XMLDoctypeError'))
+        self.assertIsNotNone(reports['e.xml'][1])
+
+    def test_max_pending_limits_the_documents_read_ahead(self):
+        reads = []
+        get_file = utils.Xray.get_file
+
+        def counting_get_file(xray, member, *args, **kwargs):
+            reads.append(member)
+            return get_file(xray, member, *args, **kwargs)
+
+        utils.Xray.get_file = counting_get_file
+        try:
+            reports = stylechecker.validate_zip_package(self.package, jobs=2,
+                                                        max_pending=2)
+            for count in range(1, 6):
+                next(reports)
+                self.assertEqual(len(reads), count + 1)
+            reports.close()
+        finally:
+            utils.Xray.get_file = get_file
+
+
+class ProcessXMLsTests(StylecheckerTestCase):
+
+    def setUp(self):
+        super(ProcessXMLsTests, self).setUp()
+        self.xmls = [self.make_xml(name + '.xml') for name in 'abcde']
+        self.xmls.insert(2, self.make_xml('broken.xml', b'<article'))
+
+    def _process(self, **kwargs):
+        return list(stylechecker._process_xmls(self.xmls, make_args(**kwargs)))
+
+    def test_parallel_results_match_the_sequential_ones(self):
+        sequential = self._process()
+        parallel = self._process(jobs=2)
+
+        self.assertEqual(parallel, sequential)
+        self.assertEqual([result[0] for result in parallel], self.xmls)
+
+    def test_unordered_results_match_the_sequential_ones(self):
+        sequential = self._process()
+        unordered = self._process(jobs=2, unordered=True)
+
+        self.assertEqual(sorted(unordered, key=lambda result: result[0]),
+                         sorted(sequential, key=lambda result: result[0]))
+
+    def test_failing_documents_do_not_abort_the_batch(self):
+        results = dict((result[0], result) for result in self._process(jobs=2))
+
+        self.assertIsNotNone(results[self.xmls[2]][3])
+        self.assertIsNone(results[self.xmls[2]][1])
+        self.assertIsNotNone(results[self.xmls[-1]][1])
+
+    def _assert_read_ahead_is_bounded(self, **kwargs):
+        reads = []
+
+        def read_xmls():
+            for xml in self.xmls:
+                reads.append(xml)
+                yield xml
+
+        results = stylechecker._process_xmls(read_xmls(),
+                                             make_args(jobs=2, **kwargs))
+        # at most twice the number of jobs are waiting for their results
+        for count in range(1, 4):
+            next(results)
+            self.assertEqual(len(reads), count + 3)
+
+        self.assertEqual(len(list(results)), 3)
+
+    def test_read_ahead_is_bounded(self):
+        self._assert_read_ahead_is_bounded()
+
+    def test_unordered_read_ahead_is_bounded(self):
+        self._assert_read_ahead_is_bounded(unordered=True)
@@ -1,8 +1,14 @@
 #coding: utf-8
 from __future__ import unicode_literals
 import unittest
+import io
+import os
+import time
+import shutil
 import zipfile
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, mkdtemp
+
+from lxml import etree
 
 from packtools import utils
 
@@ -52,6 +58,198 @@ class CachedMethodTests(unittest.TestCase):
         self.assertEqual(a.counter, 2)
 
 
+class LRUCacheTests(unittest.TestCase):
+
+    def test_get_missing_key(self):
+        cache = utils.LRUCache(2)
+        self.assertRaises(KeyError, lambda: cache['foo'])
+        self.assertEqual(cache.get('foo'), None)
+
+    def test_set_and_get(self):
+        cache = utils.LRUCache(2)
+        cache['foo'] = 'bar'
+        self.assertEqual(cache['foo'], 'bar')
+        self.assertTrue('foo' in cache)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['a']
+        cache['c'] = 3
+
+        self.assertEqual(len(cache), 2)
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertTrue('c' in cache)
+
+    def test_clear(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class AhoCorasickTests(unittest.TestCase):
+
+    def test_found_patterns(self):
+        matcher = utils.AhoCorasick(['he', 'she', 'his', 'hers'])
+        self.assertEqual(matcher.search('ushers'), set(['he', 'she', 'hers']))
+
+    def test_no_patterns_found(self):
+        matcher = utils.AhoCorasick(['foo', 'bar'])
+        self.assertEqual(matcher.search('baz'), set())
+
+    def test_overlapping_patterns(self):
+        matcher = utils.AhoCorasick(['04/08142-0', '08142', '2-0'])
+        self.assertEqual(matcher.search('FAPESP 04/08142-0'),
+                         set(['04/08142-0', '08142', '2-0']))
+
+    def test_pattern_that_is_a_suffix_of_a_failed_match(self):
+        matcher = utils.AhoCorasick(['abcd', 'bce'])
+        self.assertEqual(matcher.search('abce'), set(['bce']))
+
+    def test_same_results_of_the_in_operator(self):
+        patterns = ['a', 'ab', 'bab', 'bc', 'bca', 'c', 'caa']
+        for text in ['abccab', 'bcaab', 'xyz', 'babca']:
+            self.assertEqual(utils.AhoCorasick(patterns).search(text),
+                             set(p for p in patterns if p in text))
+
+
+class TimingsTests(unittest.TestCase):
+
+    def test_measure_records_the_stage(self):
+        timings = utils.Timings()
+        with timings.measure('foo'):
+            pass
+
+        self.assertEqual(list(timings.stages), ['foo'])
+        self.assertEqual(timings.stages['foo']['count'], 1)
+        self.assertTrue(timings.stages['foo']['wall'] >= 0)
+        self.assertTrue(timings.stages['foo']['cpu'] >= 0)
+
+    def test_measure_records_the_stage_on_exceptions(self):
+        timings = utils.Timings()
+        try:
+            with timings.measure('foo'):
+                raise ValueError()
+        except ValueError:
+            pass
+
+        self.assertEqual(timings.stages['foo']['count'], 1)
+
+    def test_times_are_accumulated(self):
+        timings = utils.Timings()
+        timings.add('foo', 1.0, 0.5)
+        timings.add('foo', 2.0, 1.0)
+
+        self.assertEqual(timings.as_dict(),
+                         {'foo': {'wall': 3.0, 'cpu': 1.5, 'count': 2}})
+
+    def test_update(self):
+        timings = utils.Timings()
+        timings.add('foo', 1.0, 0.5)
+
+        other = utils.Timings()
+        other.add('foo', 2.0, 1.0)
+        other.add('bar', 1.0, 1.0)
+
+        timings.update(other)
+        timings.update(other.as_dict())
+
+        self.assertEqual(timings.as_dict(),
+                         {'foo': {'wall': 5.0, 'cpu': 2.5, 'count': 3},
+                          'bar': {'wall': 2.0, 'cpu': 2.0, 'count': 2}})
+
+
+class ResultCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = mkdtemp()
+        self.path = os.path.join(self.cache_dir, 'results', 'cache.sqlite3')
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.cache_dir)
+
+    def _make_cache(self, fingerprint='foo'):
+        cache = utils.ResultCache(self.path, fingerprint)
+        self.caches.append(cache)
+        return cache
+
+    def test_results_are_persisted(self):
+        self._make_cache().set('key', {'is_valid': True, 'sps_errors': []})
+
+        self.assertEqual(self._make_cache().get('key'),
+                         {'is_valid': True, 'sps_errors': []})
+
+    def test_missing_keys(self):
+        self.assertIsNone(self._make_cache().get('key'))
+
+    def test_results_of_other_fingerprints_are_not_returned(self):
+        self._make_cache().set('key', {'is_valid': True})
+
+        self.assertIsNone(self._make_cache('bar').get('key'))
+
+    def test_results_of_other_fingerprints_are_kept_apart(self):
+        self._make_cache().set('key', {'is_valid': True})
+        self._make_cache('bar').set('key', {'is_valid': False})
+
+        self.assertEqual(self._make_cache().get('key'), {'is_valid': True})
+        self.assertEqual(self._make_cache('bar').get('key'),
+                         {'is_valid': False})
+
+    def test_prune_keeps_results_of_other_fingerprints(self):
+        self._make_cache().set('key', {'is_valid': True})
+        cache = self._make_cache('bar')
+        cache.set('other key', {'is_valid': False})
+
+        self.assertEqual(cache.prune(3600), 0)
+        self.assertEqual(len(cache), 2)
+
+    def test_prune_removes_results_of_other_fingerprints_on_request(self):
+        self._make_cache().set('key', {'is_valid': True})
+        cache = self._make_cache('bar')
+        cache.set('other key', {'is_valid': False})
+
+        self.assertEqual(cache.prune(3600, other_fingerprints=True), 1)
+        self.assertEqual(len(cache), 1)
+
+    def test_prune_removes_results_not_accessed(self):
+        cache = self._make_cache()
+        cache.set('key', {'is_valid': True})
+        self._make_cache('bar').set('key', {'is_valid': True})
+        time.sleep(0.01)
+
+        self.assertEqual(cache.prune(3600), 0)
+        self.assertEqual(cache.prune(0), 2)
+        self.assertEqual(len(cache), 0)
+
+
+class DirectoryCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_values_are_persisted(self):
+        utils.DirectoryCache(self.cache_dir)['abcdef'] = b'<html/>'
+
+        cache = utils.DirectoryCache(self.cache_dir)
+        self.assertEqual(cache['abcdef'], b'<html/>')
+        self.assertIn('abcdef', cache)
+
+    def test_get_missing_key(self):
+        cache = utils.DirectoryCache(self.cache_dir)
+        self.assertRaises(KeyError, lambda: cache['abcdef'])
+        self.assertEqual(cache.get('abcdef'), None)
+        self.assertNotIn('abcdef', cache)
+
+
 class XrayTests(unittest.TestCase):
 
     def _make_test_archive(self, arch_data):
@@ -112,3 +310,71 @@ class XrayTests(unittest.TestCase):
             self.assertEqual(xray.show_sorted_members(),
                     {'xml': ['bar.xml', 'jar.XML']})
 
+
+
+class XMLTests(unittest.TestCase):
+
+    sample = b'<a>\n  <b>foo</b>\n  <c/>\n</a>'
+
+    def test_blank_text_is_removed_without_the_dtd(self):
+        et = utils.XML(io.BytesIO(self.sample), load_dtd=False)
+
+        self.assertEqual(etree.tostring(et), b'<a><b>foo</b><c/></a>')
+
+    def test_blank_text_can_be_kept(self):
+        et = utils.XML(io.BytesIO(self.sample), load_dtd=False,
+                       remove_blank_text=False)
+
+        self.assertEqual(etree.tostring(et), self.sample)
+
+
+class RemoveBlankTextTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dtd = etree.DTD(io.StringIO(
+            '<!ELEMENT a (b, c)>'
+            '<!ELEMENT b (#PCDATA | i)*>'
+            '<!ELEMENT c EMPTY>'
+            '<!ELEMENT i (#PCDATA)>'))
+
+    def test_blank_text_of_element_content_is_removed(self):
+        et = etree.parse(io.BytesIO(b'<a>\n  <b>foo</b>\n  <c/>\n</a>'))
+        utils.remove_blank_text(et, self.dtd)
+
+        self.assertEqual(etree.tostring(et), b'<a><b>foo</b><c/></a>')
+
+    def test_blank_text_of_mixed_content_is_kept(self):
+        et = etree.parse(io.BytesIO(b'<a><b><i>foo</i> <i>bar</i></b><c/></a>'))
+        utils.remove_blank_text(et, self.dtd)
+
+        self.assertEqual(etree.tostring(et),
+                         b'<a><b><i>foo</i> <i>bar</i></b><c/></a>')
+
+    def test_undeclared_elements_are_kept(self):
+        et = etree.parse(io.BytesIO(b'<x>\n  <b>foo</b>\n</x>'))
+        utils.remove_blank_text(et, self.dtd)
+
+        self.assertEqual(etree.tostring(et), b'<x>\n  <b>foo</b>\n</x>')
+
+    def test_xml_space_preserve_is_respected(self):
+        et = etree.parse(io.BytesIO(
+            b'<a xml:space="preserve">\n  <b>foo</b>\n  <c/>\n</a>'))
+        utils.remove_blank_text(et, self.dtd)
+
+        self.assertEqual(etree.tostring(et),
+                         b'<a xml:space="preserve">\n  <b>foo</b>\n  <c/>\n</a>')
+
+    def test_inherited_xml_space_preserve_is_respected(self):
+        et = etree.parse(io.BytesIO(
+            b'<x xml:space="preserve"><a>\n  <b>foo</b>\n  <c/>\n</a></x>'))
+        utils.remove_blank_text(et, self.dtd)
+
+        self.assertEqual(etree.tostring(et),
+                b'<x xml:space="preserve"><a>\n  <b>foo</b>\n  <c/>\n</a></x>')
+
+    def test_non_breaking_spaces_are_not_blank(self):
+        et = etree.parse(io.BytesIO(
+            '<a>\u00a0<b>foo</b><c/></a>'.encode('utf-8')))
+        utils.remove_blank_text(et, self.dtd)
+
+        self.assertEqual(et.getroot().text, '\u00a0')
@@ -2,11 +2,13 @@
 from __future__ import unicode_literals
 import unittest
 import io
-from tempfile import NamedTemporaryFile
+import os
+import shutil
+from tempfile import NamedTemporaryFile, mkdtemp
 
 from lxml import etree, isoschematron
 
-from packtools import domain, style_errors, exceptions
+from packtools import domain, style_errors, exceptions, catalogs
 
 
 # valid: <a><b></b></a>
@@ -35,6 +37,25 @@ sample_sch = io.BytesIO(b'''\
 ''')
 
 
+def make_validator(xml, sps_version='sps-1.1', sample_schemas=True,
+                   extra_sch=None, **kwargs):
+    """Returns an `XMLValidator` for the bytes `xml`. Unless `sample_schemas`
+    is false, the DTD and the schematron of `sps_version` are replaced by
+    `sample_xsd` and `sample_sch`. `extra_sch` is the extra schematron, as
+    bytes.
+    """
+    xml = domain.XMLValidator(etree.parse(io.BytesIO(xml)),
+                              sps_version=sps_version, **kwargs)
+    if sample_schemas:
+        xml.dtd = etree.XMLSchema(etree.parse(io.BytesIO(sample_xsd.getvalue())))
+        xml.schematron = isoschematron.Schematron(
+                etree.parse(io.BytesIO(sample_sch.getvalue())))
+    if extra_sch is not None:
+        xml.extra_schematron = isoschematron.Schematron(
+                etree.parse(io.BytesIO(extra_sch)))
+    return xml
+
+
 def setup_tmpfile(method):
     def wrapper(self):
         valid_tmpfile = NamedTemporaryFile()
@@ -122,6 +143,13 @@ class XMLValidatorTests(unittest.TestCase):
 
         self.assertIn(u"<!--SPS-ERROR: Element 'c': This element is not expected. Expected is ( b ).-->", xml_text.decode())
 
+    def test_element_index_is_built_once(self):
+        fp = etree.parse(io.BytesIO(b'<a><c>bar</c></a>'))
+        xml = domain.XMLValidator.parse(fp, no_doctype=True, sps_version='sps-1.1')
+
+        self.assertIsInstance(xml.element_index, style_errors.ElementIndex)
+        self.assertIs(xml.element_index, xml.element_index)
+
     def test_validation_schematron(self):
         fp = etree.parse(io.BytesIO(b'<Total><Percent>70</Percent><Percent>30</Percent></Total>'))
         xml = domain.XMLValidator.parse(fp, no_doctype=True, sps_version='sps-1.1')
@@ -229,6 +257,192 @@ class XMLValidatorTests(unittest.TestCase):
         self.assertEqual(xml_validator.assets, [])
 
 
+class XMLValidatorTimingTests(unittest.TestCase):
+
+    xml = b'<Total><Percent>100</Percent></Total>'
+
+    def test_timing_is_disabled_by_default(self):
+        xml = make_validator(self.xml)
+        xml.validate_all()
+
+        self.assertIsNone(xml.timings)
+
+    def test_stages_are_recorded(self):
+        xml = make_validator(self.xml, timing=True)
+        xml.annotate_errors()
+
+        self.assertEqual(list(xml.timings.stages),
+                         ['dtd', 'pipeline', 'schematron', 'annotate'])
+
+    def test_cached_results_are_not_recorded_again(self):
+        xml = make_validator(self.xml, timing=True)
+        xml.validate_all()
+        xml.validate_all()
+
+        self.assertEqual(xml.timings.stages['dtd']['count'], 1)
+        self.assertEqual(xml.timings.stages['schematron']['count'], 1)
+
+
+class XMLValidatorConcurrentTests(unittest.TestCase):
+
+    extra_sch = b'''\
+    <schema xmlns="http://purl.oclc.org/dsdl/schematron">
+      <pattern id="two_elements">
+        <rule context="Total">
+          <assert test="count(//Percent) &lt; 3">Element 'Total': More than 2 elements.</assert>
+        </rule>
+      </pattern>
+    </schema>
+    '''
+
+    xml = b'<Total><Percent>70</Percent><Percent>20</Percent><Percent>20</Percent></Total>'
+
+    def test_same_results_of_the_sequential_run(self):
+        sequential = make_validator(self.xml, extra_sch=self.extra_sch)
+        concurrent = make_validator(self.xml, extra_sch=self.extra_sch,
+                                    concurrent=True)
+
+        seq_result, seq_errors = sequential.validate_all()
+        con_result, con_errors = concurrent.validate_all()
+
+        self.assertEqual(seq_result, con_result)
+        self.assertEqual([err.message for err in seq_errors],
+                         [err.message for err in con_errors])
+        self.assertEqual([err.message for err in con_errors][-2:], [
+            "Element 'Total': Sum is not 100%.",
+            "Element 'Total': More than 2 elements."])
+
+    def test_undefined_dtd(self):
+        xml = make_validator(self.xml, extra_sch=self.extra_sch,
+                             concurrent=True)
+        xml.dtd = None
+
+        result, errors = xml.validate_all()
+        self.assertFalse(result)
+        self.assertEqual([err.message for err in errors][-2:], [
+            "Element 'Total': Sum is not 100%.",
+            "Element 'Total': More than 2 elements."])
+
+    def test_undefined_dtd_with_fail_fast(self):
+        xml = make_validator(self.xml, extra_sch=self.extra_sch,
+                             concurrent=True)
+        xml.dtd = None
+
+        self.assertRaises(exceptions.UndefinedDTDError,
+                          lambda: xml.validate_all(fail_fast=True))
+
+    def test_the_pool_of_threads_is_reused(self):
+        make_validator(self.xml, extra_sch=self.extra_sch,
+                       concurrent=True).validate_all()
+        pool = domain._get_validation_pool()
+
+        make_validator(self.xml, extra_sch=self.extra_sch,
+                       concurrent=True).validate_all()
+        self.assertIs(domain._get_validation_pool(), pool)
+        self.assertIsNot(domain._get_render_pool(), pool)
+
+
+class XMLValidatorTriageTests(unittest.TestCase):
+
+    doctype = ('<!DOCTYPE article PUBLIC "-//NLM//DTD JATS (Z39.96) Journal '
+               'Publishing DTD v1.0 20120330//EN" "JATS-journalpublishing1.dtd">')
+
+    # the value of xref/@ref-type is checked by a triage pattern
+    article = '<article><xref ref-type="foo" rid="x"/></article>'
+
+    dtd = """\
+<!ELEMENT article (xref)>
+<!ELEMENT xref EMPTY>
+<!ATTLIST xref ref-type CDATA #IMPLIED rid CDATA #IMPLIED>
+"""
+
+    def _make_validator(self, doctype=None, **kwargs):
+        xml = make_validator(
+                ((doctype or self.doctype) + self.article).encode('utf-8'),
+                sps_version='sps-1.5', sample_schemas=False, timing=True,
+                **kwargs)
+        xml.dtd = etree.DTD(io.StringIO(self.dtd))
+        return xml
+
+    def test_unsupported_public_id(self):
+        xml = self._make_validator(doctype='<!DOCTYPE article PUBLIC "foo" "bar">')
+
+        result, errors = xml.triage()
+        self.assertFalse(result)
+        self.assertEqual(errors[0].message,
+                         'Unsupported DOCTYPE public id: foo')
+        self.assertEqual(list(xml.timings.stages), [])
+
+    def test_stops_at_the_pipeline(self):
+        xml = self._make_validator(doctype=' ')
+
+        result, errors = xml.triage()
+        self.assertFalse(result)
+        self.assertEqual([err.message for err in errors],
+                         ['Missing DOCTYPE declaration.'])
+        self.assertEqual(list(xml.timings.stages), ['pipeline'])
+
+    def test_stops_at_the_dtd(self):
+        xml = self._make_validator()
+        xml.dtd = etree.DTD(io.StringIO('<!ELEMENT article (front)>'))
+
+        result, errors = xml.triage()
+        self.assertFalse(result)
+        self.assertEqual(list(xml.timings.stages), ['pipeline', 'dtd'])
+
+    def test_stops_at_the_triage_patterns(self):
+        xml = self._make_validator()
+
+        result, errors = xml.triage()
+        self.assertFalse(result)
+        self.assertTrue(errors)
+        self.assertTrue(all(err.pattern_id in domain.TRIAGE_PATTERNS
+                            for err in errors))
+        self.assertEqual(list(xml.timings.stages),
+                         ['pipeline', 'dtd', 'triage'])
+
+    def test_runs_the_whole_schema_if_triage_patterns_pass(self):
+        xml = self._make_validator()
+        triage_patterns = domain.TRIAGE_PATTERNS
+        domain.TRIAGE_PATTERNS = ('month',)
+        try:
+            result, errors = xml.triage()
+        finally:
+            domain.TRIAGE_PATTERNS = triage_patterns
+
+        self.assertFalse(result)
+        self.assertEqual(list(xml.timings.stages),
+                         ['pipeline', 'dtd', 'triage', 'schematron'])
+        self.assertEqual((result, errors), xml.validate_style())
+
+    def test_undefined_dtd_is_skipped(self):
+        xml = self._make_validator()
+        xml.dtd = None
+
+        result, errors = xml.triage()
+        self.assertFalse(result)
+        self.assertEqual(list(xml.timings.stages), ['pipeline', 'triage'])
+
+    def test_only_the_triage_patterns_of_the_phases_are_validated(self):
+        xml = self._make_validator(phases=['phase.article-id'])
+
+        result, errors = xml.triage()
+        self.assertEqual((result, errors), (xml.validate_all()[0], []))
+        self.assertEqual(list(xml.timings.stages),
+                         ['pipeline', 'dtd', 'schematron'])
+
+    def test_phases_with_triage_patterns(self):
+        xml = self._make_validator(phases=['phase.xref_reftype_integrity'])
+
+        result, errors = xml.triage()
+        self.assertFalse(result)
+        self.assertEqual(set(err.pattern_id for err in errors),
+                         set(['xref-reftype-values']))
+        self.assertEqual(list(xml.timings.stages),
+                         ['pipeline', 'dtd', 'triage'])
+        self.assertFalse(xml.validate_all()[0])
+
+
 class XMLValidatorExtraSchematronTests(unittest.TestCase):
 
     def test_valid_extra_schematron(self):
@@ -253,6 +467,31 @@ class XMLValidatorExtraSchematronTests(unittest.TestCase):
         self.assertEqual(len(errors), 1)
         self.assertEqual(errors[0].message, "Element 'Total': More than 2 elements.")
 
+    def test_extra_schematron_is_compiled_once(self):
+        tmp = NamedTemporaryFile(suffix='.sch')
+        tmp.write(sample_sch.getvalue())
+        tmp.flush()
+
+        validators = [domain.XMLValidator.parse(
+            etree.parse(io.BytesIO(b'<Total><Percent>100</Percent></Total>')),
+            no_doctype=True, sps_version='sps-1.1', extra_schematron=tmp.name)
+            for _ in range(2)]
+
+        self.assertIs(validators[0].extra_schematron,
+                      validators[1].extra_schematron)
+
+    def test_changes_on_extra_schematron_are_detected(self):
+        tmp = NamedTemporaryFile(suffix='.sch')
+        tmp.write(sample_sch.getvalue())
+        tmp.flush()
+
+        first = domain.Schematron(tmp.name, cache_dir='')
+        tmp.write(b'<!-- changed -->')
+        tmp.flush()
+        second = domain.Schematron(tmp.name, cache_dir='')
+
+        self.assertIsNot(first, second)
+
     def test_invalid_extra_schematron_raises_ValueError_on_init(self):
         invalid_extra_sch = b'''\
         <schema xmlns="http://purl.oclc.org/dsdl/schematron">
@@ -273,3 +512,350 @@ class XMLValidatorExtraSchematronTests(unittest.TestCase):
             fp, no_doctype=True, sps_version='sps-1.1',
             extra_schematron=tmp.name))
 
+
+
+class SchematronCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = mkdtemp()
+        self.sch_file = NamedTemporaryFile(suffix='.sch')
+        self.sch_file.write(sample_sch.getvalue())
+        self.sch_file.seek(0)
+
+    def tearDown(self):
+        self.sch_file.close()
+        shutil.rmtree(self.cache_dir)
+
+    def _load(self, cache_dir=None):
+        """Loads the schema bypassing the in-memory cache.
+        """
+        if hasattr(domain.Schematron, 'cache'):
+            domain.Schematron.cache.clear()
+
+        if cache_dir is None:
+            cache_dir = self.cache_dir
+        return domain.Schematron(self.sch_file.name, cache_dir=cache_dir)
+
+    def _cached_files(self):
+        cached_files = []
+        for root, _, files in os.walk(self.cache_dir):
+            cached_files.extend(os.path.join(root, f) for f in files)
+        return cached_files
+
+    def test_compiled_schema_is_persisted(self):
+        self._load()
+        self.assertEqual(len(self._cached_files()), 1)
+
+    def test_cached_schema_is_loaded(self):
+        self._load()
+        schematron = self._load()
+
+        self.assertIsInstance(schematron, domain._PrecompiledSchematron)
+
+    def test_cached_schema_validates(self):
+        self._load()
+        schematron = self._load()
+
+        valid = etree.parse(io.BytesIO(b'<Total><Percent>70</Percent><Percent>30</Percent></Total>'))
+        invalid = etree.parse(io.BytesIO(b'<Total><Percent>60</Percent><Percent>30</Percent></Total>'))
+
+        self.assertTrue(schematron.validate(valid))
+        self.assertFalse(schematron.validate(invalid))
+        self.assertIn("Element 'Total': Sum is not 100%.",
+                      schematron.error_log[0].message)
+
+    def test_changes_on_schema_invalidates_the_cache(self):
+        self._load()
+
+        self.sch_file.seek(0, os.SEEK_END)
+        self.sch_file.write(b'<!-- changed -->')
+        self.sch_file.flush()
+        schematron = self._load()
+
+        self.assertNotIsInstance(schematron, domain._PrecompiledSchematron)
+        self.assertEqual(len(self._cached_files()), 2)
+
+    def test_corrupted_entries_are_replaced(self):
+        self._load()
+        cached_file = self._cached_files()[0]
+        with open(cached_file, 'wb') as fp:
+            fp.write(b'<corrupted')
+
+        schematron = self._load()
+        self.assertNotIsInstance(schematron, domain._PrecompiledSchematron)
+
+        schematron = self._load()
+        self.assertIsInstance(schematron, domain._PrecompiledSchematron)
+
+    def test_empty_cache_dir_disables_the_cache(self):
+        schematron = self._load(cache_dir='')
+
+        self.assertEqual(self._cached_files(), [])
+        self.assertIsInstance(schematron, isoschematron.Schematron)
+
+    def test_warm_cache(self):
+        schemas = domain.warm_schematron_cache([self.sch_file.name],
+                                               cache_dir=self.cache_dir)
+
+        self.assertEqual(schemas, [self.sch_file.name])
+        self.assertEqual(len(self._cached_files()), 1)
+
+    def test_warm_cache_prunes_entries_no_longer_current(self):
+        self._load()
+        self.sch_file.seek(0, os.SEEK_END)
+        self.sch_file.write(b'<!-- changed -->')
+        self.sch_file.flush()
+        old_layout_dir = os.path.join(self.cache_dir, 'schematron-v0')
+        os.makedirs(old_layout_dir)
+        open(os.path.join(old_layout_dir, 'foo.xslt'), 'wb').close()
+
+        domain.warm_schematron_cache([self.sch_file.name],
+                                     cache_dir=self.cache_dir, prune=True)
+
+        self.assertEqual(self._cached_files(), [
+            domain._get_schematron_cache_path(
+                etree.parse(self.sch_file.name), self.cache_dir)])
+        self.assertIsInstance(self._load(), domain._PrecompiledSchematron)
+
+    def test_warm_cache_does_not_prune_by_default(self):
+        self._load()
+        self.sch_file.seek(0, os.SEEK_END)
+        self.sch_file.write(b'<!-- changed -->')
+        self.sch_file.flush()
+
+        domain.warm_schematron_cache([self.sch_file.name],
+                                     cache_dir=self.cache_dir)
+
+        self.assertEqual(len(self._cached_files()), 2)
+
+    def test_changes_on_nested_inclusions_invalidates_the_cache(self):
+        sch_dir = mkdtemp(dir=self.cache_dir)
+        files = {
+            'main.sch': b'''<schema xmlns="http://purl.oclc.org/dsdl/schematron">
+                <include href="patterns/pattern.sch"/></schema>''',
+            'patterns/pattern.sch': b'''<pattern xmlns="http://purl.oclc.org/dsdl/schematron" id="total">
+                <include href="rule.sch"/></pattern>''',
+            'patterns/rule.sch': b'''<rule xmlns="http://purl.oclc.org/dsdl/schematron" context="Total">
+                <assert test="count(Percent) = 2">Two percents.</assert></rule>''',
+        }
+        os.makedirs(os.path.join(sch_dir, 'patterns'))
+        for name, content in files.items():
+            with open(os.path.join(sch_dir, name), 'wb') as fp:
+                fp.write(content)
+
+        main_sch = os.path.join(sch_dir, 'main.sch')
+        sources = list(domain._iter_schematron_sources(etree.parse(main_sch)))
+        self.assertEqual([os.path.relpath(source, sch_dir) for source in sources],
+                         ['main.sch', os.path.join('patterns', 'pattern.sch'),
+                          os.path.join('patterns', 'rule.sch')])
+
+        key = domain._schematron_cache_key(etree.parse(main_sch))
+        with open(os.path.join(sch_dir, 'patterns', 'rule.sch'), 'ab') as fp:
+            fp.write(b'<!-- changed -->')
+
+        self.assertNotEqual(domain._schematron_cache_key(etree.parse(main_sch)),
+                            key)
+
+
+class CompositeSchematronTests(unittest.TestCase):
+
+    extra_sch = b'''\
+    <schema xmlns="http://purl.oclc.org/dsdl/schematron">
+      <ns uri="http://www.w3.org/1999/xlink" prefix="xlink"/>
+      <pattern id="sum_equals_100_percent">
+        <title>Max 2 elements allowed.</title>
+        <rule context="Total">
+          <assert test="count(//Percent) &lt; 3">Element 'Total': More than 2 elements.</assert>
+        </rule>
+      </pattern>
+    </schema>
+    '''
+
+    def setUp(self):
+        self.sch_file = NamedTemporaryFile(suffix='.sch')
+        self.sch_file.write(sample_sch.getvalue())
+        self.sch_file.flush()
+
+        self.extra_sch_file = NamedTemporaryFile(prefix='extra', suffix='.sch')
+        self.extra_sch_file.write(self.extra_sch)
+        self.extra_sch_file.flush()
+
+        self.files = [self.sch_file.name, self.extra_sch_file.name]
+
+    def tearDown(self):
+        self.sch_file.close()
+        self.extra_sch_file.close()
+
+    def test_errors_of_all_schemas_are_reported_in_order(self):
+        schematron = domain.CompositeSchematron(self.files, cache_dir='')
+        fp = etree.parse(io.BytesIO(b'<Total><Percent>70</Percent><Percent>20</Percent><Percent>20</Percent></Total>'))
+
+        self.assertFalse(schematron.validate(fp))
+        errors = style_errors.make_schematron_errors(schematron)
+        self.assertEqual([err.message for err in errors],
+                         ["Element 'Total': Sum is not 100%.",
+                          "Element 'Total': More than 2 elements."])
+
+    def test_errors_are_attributed_to_their_schemas(self):
+        schematron = domain.CompositeSchematron(self.files, cache_dir='')
+        fp = etree.parse(io.BytesIO(b'<Total><Percent>70</Percent><Percent>20</Percent><Percent>20</Percent></Total>'))
+
+        schematron.validate(fp)
+        errors = style_errors.make_schematron_errors(schematron)
+        self.assertEqual([err.schema for err in errors], self.files)
+
+    def test_colliding_pattern_ids_are_renamed(self):
+        schematron = domain.CompositeSchematron(self.files, cache_dir='')
+        label = os.path.splitext(os.path.basename(self.extra_sch_file.name))[0]
+
+        self.assertEqual(list(schematron.pattern_sources.keys()),
+                         ['sum_equals_100_percent',
+                          label + '.sum_equals_100_percent'])
+
+    def test_conflicting_namespace_prefixes_raise_ValueError(self):
+        self.sch_file.seek(0)
+        self.sch_file.truncate()
+        self.sch_file.write(sample_sch.getvalue().replace(
+            b'<pattern', b'<ns uri="http://foo" prefix="xlink"/><pattern', 1))
+        self.sch_file.flush()
+
+        self.assertRaises(ValueError,
+                          lambda: domain.CompositeSchematron(self.files,
+                                                             cache_dir=''))
+
+    def test_instances_are_cached(self):
+        self.assertIs(domain.CompositeSchematron(self.files, cache_dir=''),
+                      domain.CompositeSchematron(self.files, cache_dir=''))
+
+    def test_attribution_survives_the_on_disk_cache(self):
+        cache_dir = mkdtemp()
+        try:
+            domain.CompositeSchematron(self.files, cache_dir=cache_dir)
+            domain.Schematron.cache.clear()
+            schematron = domain.CompositeSchematron(self.files,
+                                                    cache_dir=cache_dir)
+        finally:
+            shutil.rmtree(cache_dir)
+
+        self.assertIsInstance(schematron, domain._PrecompiledSchematron)
+        self.assertEqual(list(schematron.pattern_sources.values()), self.files)
+
+    def test_xmlvalidator_merges_the_extra_schematron(self):
+        fp = etree.parse(io.BytesIO(b'<Total><Percent>70</Percent><Percent>20</Percent><Percent>10</Percent></Total>'))
+        xml = domain.XMLValidator.parse(fp, no_doctype=True,
+                sps_version='sps-1.1', extra_schematron=self.extra_sch_file.name,
+                merge_schematron=True)
+
+        self.assertIsNone(xml.extra_schematron)
+
+        result, errors = xml._validate_sch()
+        self.assertFalse(result)
+        self.assertEqual(errors[-1].message,
+                         "Element 'Total': More than 2 elements.")
+        self.assertEqual(errors[-1].schema, self.extra_sch_file.name)
+
+
+class SchematronPhasesTests(unittest.TestCase):
+
+    article = b'''\
+    <article article-type="foo" specific-use="sps-1.5" xml:lang="en">
+      <xref ref-type="foo" rid="x"/>
+    </article>
+    '''
+
+    def test_validators_are_cached_per_phases(self):
+        license = domain.StdSchematron('sps-1.5', phases=['phase.license'])
+
+        self.assertIs(license, domain.StdSchematron('sps-1.5',
+                                                    phases=['phase.license']))
+        self.assertIsNot(license, domain.StdSchematron('sps-1.5'))
+
+    def test_profiles_are_resolved(self):
+        self.assertIs(
+            domain.StdSchematron('sps-1.5', phases=['references-only']),
+            domain.StdSchematron('sps-1.5', phases=
+                domain.SCHEMATRON_PROFILES['references-only']))
+
+    def test_unknown_phases_raise_ValueError(self):
+        self.assertRaises(ValueError,
+                lambda: domain.StdSchematron('sps-1.5', phases=['phase.foo']))
+
+    def test_unknown_phases_among_known_ones_raise_ValueError(self):
+        self.assertRaises(ValueError,
+                lambda: domain.StdSchematron('sps-1.5',
+                    phases=['phase.foo', 'phase.license']))
+        self.assertRaises(ValueError,
+                lambda: domain.StdSchematron('sps-1.5',
+                    phases=['phase.foo', 'metadata-only']))
+
+    def test_profile_phases_missing_from_the_schema_are_left_out(self):
+        self.assertNotIn('phase.contrib-id', domain._get_phases(
+                catalogs.SCHEMAS['sps-1.3']))
+        self.assertIsNotNone(
+                domain.StdSchematron('sps-1.3', phases=['metadata-only']))
+        self.assertRaises(ValueError,
+                lambda: domain.StdSchematron('sps-1.3',
+                    phases=['phase.contrib-id']))
+
+    def test_only_the_patterns_of_the_phases_are_validated(self):
+        fp = etree.parse(io.BytesIO(self.article))
+        xml = domain.XMLValidator.parse(fp, no_doctype=True,
+                phases=['phase.xref_reftype_integrity'])
+
+        result, errors = xml._validate_sch()
+        self.assertFalse(result)
+        self.assertEqual(set(err.pattern_id for err in errors),
+                         set(['xref-reftype-values']))
+
+    def test_phases_cannot_be_merged(self):
+        fp = etree.parse(io.BytesIO(self.article))
+        self.assertRaises(ValueError,
+                lambda: domain.XMLValidator.parse(fp, no_doctype=True,
+                    extra_schematron=catalogs.SCHEMAS['scielo-br'],
+                    merge_schematron=True, phases=['phase.license']))
+
+
+class LoadValidatorsTests(unittest.TestCase):
+
+    def setUp(self):
+        if hasattr(domain.Schematron, 'cache'):
+            domain.Schematron.cache.clear()
+
+    def test_only_the_schemas_restricted_to_the_phases_are_loaded(self):
+        domain.load_validators(phases=['metadata-only'])
+        loaded = len(domain.Schematron.cache)
+
+        for version in domain.CURRENTLY_SUPPORTED_VERSIONS:
+            domain.StdSchematron(version, phases=['metadata-only'])
+        self.assertEqual(len(domain.Schematron.cache), loaded)
+
+        domain.Schematron(catalogs.SCHEMAS['sps-1.5'])
+        self.assertEqual(len(domain.Schematron.cache), loaded + 1)
+
+    def test_the_whole_schemas_are_loaded_by_default(self):
+        domain.load_validators()
+        loaded = len(domain.Schematron.cache)
+
+        domain.Schematron(catalogs.SCHEMAS['sps-1.5'])
+        self.assertEqual(len(domain.Schematron.cache), loaded)
+
+
+class StdDTDTests(unittest.TestCase):
+
+    public_id = '-//NLM//DTD JATS (Z39.96) Journal Publishing DTD v1.0 20120330//EN'
+
+    def test_is_loaded_once(self):
+        self.assertIs(domain.StdDTD(self.public_id),
+                      domain.StdDTD(self.public_id))
+
+    def test_unknown_public_id_raises_ValueError(self):
+        self.assertRaises(ValueError, lambda: domain.StdDTD('-//FOO//DTD Bar//EN'))
+
+    def test_is_used_when_the_dtd_was_not_loaded(self):
+        fp = io.BytesIO(b'''<!DOCTYPE article PUBLIC "%s" "JATS-journalpublishing1.dtd">
+<article specific-use="sps-1.5" dtd-version="1.0"/>''' % self.public_id.encode('ascii'))
+        et = etree.parse(fp, etree.XMLParser(load_dtd=False, no_network=True))
+        self.assertIsNone(et.docinfo.externalDTD)
+
+        xml_validator = domain.XMLValidator.parse(et)
+        self.assertIs(xml_validator.dtd, domain.StdDTD(self.public_id))